@@ -0,0 +1,114 @@
+import argparse
+import asyncio
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import http_client
+import instrumentation
+import main as pipeline
+import rate_limit
+from main import DAILY_THEMES, find_product, products_for_category, run_article, run_article_async
+
+# ==========================================
+# バッチ投稿（複数記事を並行して生成・投稿）
+# ==========================================
+def resolve_targets(product_ids, category_name=None, all_products=False):
+    """指定内容から (商材, カテゴリ名) のリストを作成"""
+    targets = []
+    if all_products:
+        for theme in DAILY_THEMES.values():
+            targets += [(p, theme["category"]) for p in theme["products"]]
+    if category_name:
+        products = products_for_category(category_name)
+        if not products:
+            print(f"⚠️ カテゴリが見つかりません: {category_name}")
+        targets += [(p, category_name) for p in products]
+    for product_id in product_ids:
+        product, category = find_product(product_id)
+        if product:
+            targets.append((product, category))
+        else:
+            print(f"⚠️ 商材IDが見つかりません: {product_id}")
+    return targets
+
+def run_one(product, category_name, use_async):
+    """1記事分を実行して結果を返す（例外はここで捕捉して他の記事に影響させない）"""
+    started = time.monotonic()
+    try:
+        if use_async:
+            post_id = asyncio.run(run_article_async(product, category_name))
+        else:
+            post_id = run_article(product, category_name)
+        error = None if post_id else "投稿IDを取得できませんでした"
+    except Exception as e:
+        post_id, error = None, str(e)
+    return {
+        "product_id": product["id"],
+        "name": product["name"],
+        "post_id": post_id,
+        "error": error,
+        "elapsed": time.monotonic() - started,
+    }
+
+def run_batch(targets, concurrency=2, use_async=False):
+    """ワーカープールで記事を並行処理し、記事ごとの結果リストを返す"""
+    results = []
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(run_one, product, category, use_async) for product, category in targets]
+        for future in as_completed(futures):
+            results.append(future.result())
+    return results
+
+def print_summary(results):
+    print("\n" + "=" * 50)
+    print("📊 バッチ処理結果")
+    print("=" * 50)
+    for r in sorted(results, key=lambda r: r["product_id"]):
+        if r["post_id"]:
+            print(f"   ✅ {r['product_id']} {r['name']}: 投稿ID={r['post_id']} ({r['elapsed']:.1f}秒)")
+        else:
+            print(f"   ❌ {r['product_id']} {r['name']}: {r['error']} ({r['elapsed']:.1f}秒)")
+    succeeded = sum(1 for r in results if r["post_id"])
+    print(f"\n   成功: {succeeded}件 / 失敗: {len(results) - succeeded}件")
+    print()
+    http_client.print_stats()
+    instrumentation.finish_run()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="複数記事をまとめて生成・投稿する")
+    parser.add_argument("product_ids", nargs="*", help="商材ID（例: MON-1 TUE-2）")
+    parser.add_argument("--category", help="指定カテゴリの全商材を対象にする（例: 睡眠・寝具）")
+    parser.add_argument("--all", dest="all_products", action="store_true", help="全カテゴリの全商材を対象にする")
+    parser.add_argument("--concurrency", type=int, default=2, help="同時に処理する記事数（デフォルト: 2）")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="記事内のAPI呼び出しも並行実行する")
+    parser.add_argument("--gemini-qpm", type=int, help="Gemini の1分あたりリクエスト上限")
+    parser.add_argument("--pexels-per-hour", type=int, help="Pexels の1時間あたりリクエスト上限")
+    parser.add_argument("--rakuten-per-second", type=int, help="楽天APIの1秒あたりリクエスト上限")
+    parser.add_argument("--new-draft", action="store_true", help="保存済みの生成結果を使わずに記事を書き直す")
+    args = parser.parse_args(argv)
+
+    if args.new_draft:
+        pipeline.FORCE_NEW_DRAFT = True
+
+    if args.gemini_qpm is not None:
+        rate_limit.configure("gemini", args.gemini_qpm, 60)
+    if args.pexels_per_hour is not None:
+        rate_limit.configure("pexels", args.pexels_per_hour, 3600)
+    if args.rakuten_per_second is not None:
+        rate_limit.configure("rakuten", args.rakuten_per_second, 1)
+
+    targets = resolve_targets(args.product_ids, args.category, args.all_products)
+    if not targets:
+        parser.error("対象の商材がありません（商材ID / --category / --all のいずれかを指定してください）")
+
+    print("=" * 50)
+    print(f"🚀 バッチ投稿開始: {len(targets)}記事 / 同時実行数 {args.concurrency}")
+    print("=" * 50)
+
+    results = run_batch(targets, args.concurrency, args.use_async)
+    print_summary(results)
+    return 0 if all(r["post_id"] for r in results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
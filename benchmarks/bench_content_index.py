@@ -0,0 +1,82 @@
+"""記事インデックス（MinHash + LSH）のベンチマーク（署名の作成時間・検索時間・類似度の推定精度）
+
+    python benchmarks/bench_content_index.py
+    python benchmarks/bench_content_index.py --docs 1000 5000 --article-kb 8
+
+ネットワークは使わず、ランダムな記事で一時ディレクトリにインデックスを作る。
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import content_index  # noqa: E402
+from fake_services import make_article_text  # noqa: E402
+
+def true_jaccard(a, b):
+    size = content_index.SHINGLE_SIZE
+    shingles_a = {a[i:i + size] for i in range(len(a) - size + 1)}
+    shingles_b = {b[i:i + size] for i in range(len(b) - size + 1)}
+    return len(shingles_a & shingles_b) / len(shingles_a | shingles_b)
+
+def rewrite(text, ratio):
+    """本文の一部（ratio の割合の段落）を別の文章に差し替えた記事"""
+    paragraphs = text.split("</p>")
+    fresh = make_article_text(len(text.encode("utf-8")) // 1024).split("</p>")
+    for i in random.sample(range(len(paragraphs)), int(len(paragraphs) * ratio)):
+        paragraphs[i] = fresh[i % len(fresh)]
+    return "</p>".join(paragraphs)
+
+def bench(docs, article_kb, queries):
+    articles = [make_article_text(article_kb) for _ in range(docs)]
+    with tempfile.TemporaryDirectory(prefix="bench_index_") as cache_dir:
+        index = content_index.ContentIndex("", None, path=os.path.join(cache_dir, "index.json"))
+        started = time.perf_counter()
+        for i, text in enumerate(articles):
+            # add() は1件ごとにファイルへ保存するため、署名とバケットの更新だけを計測する
+            index._put(str(i), "", text)
+        build = time.perf_counter() - started
+
+        lookups, hits = [], 0
+        for i in random.sample(range(docs), min(queries, docs)):
+            sig = content_index.signature(content_index.normalize(rewrite(articles[i], 0.2)))
+            started = time.perf_counter()
+            match = index.find_similar_signature(sig, 0.5)
+            lookups.append(time.perf_counter() - started)
+            hits += bool(match and match[0] == str(i))
+        misses = [index.find_similar(f"新規{i}", make_article_text(article_kb), 0.5) for i in range(queries)]
+    return {
+        "signature_ms": build / docs * 1000,
+        "lookup_us": statistics.median(lookups) * 1e6,
+        "recall": hits / len(lookups),
+        "false_positives": sum(1 for m in misses if m),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs", type=int, nargs="+", default=[1000, 5000], help="インデックスの記事数")
+    parser.add_argument("--article-kb", type=int, default=8, help="記事のおおよそのサイズ（KB、デフォルト: 8）")
+    parser.add_argument("--queries", type=int, default=200, help="検索回数（デフォルト: 200）")
+    args = parser.parse_args(argv)
+
+    random.seed(0)
+    base = make_article_text(args.article_kb)
+    print("類似度の推定精度（真の Jaccard 係数 → 署名からの推定値）")
+    for ratio in (0.1, 0.3, 0.5, 0.8):
+        other = rewrite(base, ratio)
+        a, b = content_index.normalize(base), content_index.normalize(other)
+        estimate = content_index.similarity(content_index.signature(a), content_index.signature(b))
+        print(f"   段落の{int(ratio * 100):>3}%を差し替え: {true_jaccard(a, b):.2f} → {estimate:.2f}")
+
+    print(f"\n{'記事数':>8} {'署名(ms/件)':>12} {'検索 中央値(µs)':>16} {'検出率':>8} {'誤検出':>8}")
+    for docs in args.docs:
+        r = bench(docs, args.article_kb, args.queries)
+        print(f"{docs:>8} {r['signature_ms']:>12.2f} {r['lookup_us']:>16.0f} {r['recall']:>8.0%} {r['false_positives']:>8}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""本文加工のマイクロベンチマーク（従来の str.replace / 正規表現の多段処理 vs html_transform）
+
+    python benchmarks/bench_html_transform.py
+    python benchmarks/bench_html_transform.py --sizes 10 100 1000 --repeat 5
+"""
+import argparse
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from html_transform import clean_html, insert_after, replace_placeholder  # noqa: E402
+
+FIGURE = '<figure style="margin: 30px 0;"><img src="https://example.com/{0}.jpg" alt="画像"/></figure>'
+AFFILIATE_BOX = '<div style="border: 2px solid #c9b99a;"><a href="https://example.com/">楽天市場で詳細を見る</a></div>'
+
+def make_article(kb):
+    """約 kb KB の合成記事（h2・段落・文字参照・マークダウン記号・エスケープ文字を含む）"""
+    section = (
+        "<h2>## 腰痛の原因</h2>\\n"
+        "<p>私の整体院に来る患者さんでも、<strong>脊柱起立筋</strong>や&#12354;大腰筋の緊張が原因です。\n"
+        "### 所長Mの見解として、姿勢の崩れは仙腸関節に負担をかけます。</p>\t"
+    )
+    body = section * max(1, kb * 1024 // len(section.encode("utf-8")))
+    half = len(body) // 2
+    return "```html\n" + body[:half] + "[[AFFILIATE_AREA]]" + body[half:] + "```"
+
+def legacy(content, image_urls):
+    """html_transform 導入前の処理（main.py の clean_text / 画像挿入 / 枠置換）"""
+    text = content.strip()
+    text = text.replace("\\n", " ").replace("\\t", " ")
+    text = text.replace("¥n", " ").replace("¥t", " ")
+    text = text.replace("\n", " ").replace("\t", " ")
+    text = text.replace("###", "").replace("##", "").replace("#", "")
+    text = text.replace("SEOタイトル:", "").replace("SEOタイトル：", "")
+    text = text.replace("メタディスクリプション:", "").replace("メタディスクリプション：", "")
+    text = text.replace("記事本文:", "").replace("記事本文：", "")
+    text = text.replace("```html", "").replace("```", "")
+    content = text.strip()
+
+    h2_matches = list(re.finditer(r"(</h2>)", content, re.IGNORECASE))
+    positions = [m.end() for m in h2_matches[:2]]
+    for idx, pos in enumerate(reversed(positions)):
+        img_idx = len(positions) - 1 - idx
+        if img_idx < len(image_urls):
+            content = content[:pos] + FIGURE.format(image_urls[img_idx]) + content[pos:]
+
+    if "[[AFFILIATE_AREA]]" in content:
+        content = content.replace("[[AFFILIATE_AREA]]", AFFILIATE_BOX)
+    else:
+        content += AFFILIATE_BOX
+    return content
+
+def current(content, image_urls):
+    """main.assemble_content と同じ処理"""
+    content, _ = insert_after(clean_html(content.strip()), "h2", [FIGURE.format(url) for url in image_urls[:2]])
+    return replace_placeholder(content, "[[AFFILIATE_AREA]]", AFFILIATE_BOX)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000], help="記事サイズ（KB）")
+    parser.add_argument("--repeat", type=int, default=5, help="計測回数（最小値を採用）")
+    args = parser.parse_args(argv)
+
+    image_urls = ["a", "b"]
+    print(f"{'サイズ':>8} {'従来(ms)':>10} {'現行(ms)':>10} {'比率':>6}")
+    for kb in args.sizes:
+        article = make_article(kb)
+        number = max(1, 2000 // kb)
+        t_legacy = min(timeit.repeat(lambda: legacy(article, image_urls), number=number, repeat=args.repeat)) / number
+        t_current = min(timeit.repeat(lambda: current(article, image_urls), number=number, repeat=args.repeat)) / number
+        print(f"{kb:>6}KB {t_legacy * 1000:>10.2f} {t_current * 1000:>10.2f} {t_current / t_legacy:>5.2f}x")
+
+    # 文字参照とCSSカラーが壊れないことの確認
+    sample = '<p style="color:#c9b99a">&#12354; ## 見出し</p>'
+    print(f"\n従来 : {legacy(sample, [])[:len(sample)]}")
+    print(f"現行 : {current(sample, [])[:len(sample)]}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""記事パイプライン全体のオフラインベンチマーク（外部APIの代わりにローカルの代替サーバーと代替モデルを使う）
+
+    python benchmarks/bench_pipeline.py
+    python benchmarks/bench_pipeline.py --articles 20 --concurrency 4 --async
+    python benchmarks/bench_pipeline.py --gemini-latency 8 --wordpress-latency 0.3 --pexels-error-rate 0.1
+    python benchmarks/bench_pipeline.py --images-payload-kb 800 --output result.json
+    python benchmarks/bench_pipeline.py --gemini-rest --stream
+
+APIキーやネットワークは不要。ローカルキャッシュは一時ディレクトリに作られ、実行後に削除される。
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_services import SERVICES, FakeModel, FakeServices, ServiceProfile  # noqa: E402
+
+# 実際のAPIに近い既定値（秒）
+DEFAULT_LATENCY = {"wordpress": 0.15, "pexels": 0.2, "images": 0.1, "rakuten": 0.2, "gemini": 3.0}
+
+def percentile(values, p):
+    """最近傍順位法によるパーセンタイル"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = max(1, -(-len(ordered) * p // 100))
+    return ordered[int(rank) - 1]
+
+def build_profiles(args):
+    return {
+        name: ServiceProfile(
+            latency=getattr(args, f"{name}_latency"),
+            error_rate=getattr(args, f"{name}_error_rate"),
+            payload_kb=getattr(args, f"{name}_payload_kb"),
+        )
+        for name in SERVICES
+    }
+
+def run(args):
+    profiles = build_profiles(args)
+    with FakeServices(profiles) as fakes, tempfile.TemporaryDirectory(prefix="bench_cache_") as cache_dir:
+        # main.py は読み込み時に環境変数を読むため、先に代替サーバーへ向けてから読み込む
+        os.environ.update(fakes.environ())
+        os.environ["CACHE_DIR"] = cache_dir
+        os.environ.setdefault("RUN_REPORT", "")
+        os.environ["GEMINI_STREAM"] = "1" if args.stream else "0"
+        if args.gemini_rest:
+            os.environ["GEMINI_PROVIDER"] = "rest"
+        import batch  # noqa: E402
+        import http_client  # noqa: E402
+        import instrumentation  # noqa: E402
+        import main as pipeline  # noqa: E402
+        import rate_limit  # noqa: E402
+
+        if not args.gemini_rest:
+            pipeline.model = FakeModel(profiles["gemini"])
+        pipeline.FORCE_NEW_DRAFT = True
+        for service in ("gemini", "pexels", "rakuten", "wordpress"):
+            rate_limit.configure(service, 0, 1)
+
+        products = [(p, theme["category"]) for theme in pipeline.DAILY_THEMES.values() for p in theme["products"]]
+        targets = list(itertools.islice(itertools.cycle(products), args.articles))
+
+        log = io.StringIO()
+        started = time.monotonic()
+        with contextlib.redirect_stdout(sys.stdout if args.verbose else log):
+            results = batch.run_batch(targets, args.concurrency, args.use_async)
+        wall = time.monotonic() - started
+
+        latencies = [r["elapsed"] for r in results if r["post_id"]]
+        return {
+            "articles": len(results),
+            "succeeded": len(latencies),
+            "concurrency": args.concurrency,
+            "async": args.use_async,
+            "stream": args.stream,
+            "wall_seconds": round(wall, 3),
+            "articles_per_minute": round(len(latencies) / wall * 60, 2) if wall else 0.0,
+            "p50_seconds": round(percentile(latencies, 50), 3),
+            "p95_seconds": round(percentile(latencies, 95), 3),
+            "max_seconds": round(max(latencies, default=0.0), 3),
+            "requests": dict(fakes.requests) if args.gemini_rest else dict(fakes.requests, gemini=pipeline.model.calls),
+            "http": http_client.stats(),
+            "stages": instrumentation.summarize(),
+            "profiles": {name: vars(profile) for name, profile in profiles.items()},
+        }
+
+def print_result(result):
+    print(f"記事数      : {result['succeeded']}/{result['articles']} 成功"
+          f"（同時実行数 {result['concurrency']}{' / --async' if result['async'] else ''}{' / ストリーミング' if result['stream'] else ''}）")
+    print(f"全体時間    : {result['wall_seconds']:.2f}秒")
+    print(f"スループット: {result['articles_per_minute']:.1f} 記事/分")
+    print(f"記事あたり  : p50 {result['p50_seconds']:.2f}秒 / p95 {result['p95_seconds']:.2f}秒 / 最大 {result['max_seconds']:.2f}秒")
+    print(f"リクエスト数: " + " / ".join(f"{name} {count}" for name, count in result["requests"].items()))
+    print("\n段階別（合計秒 / 呼び出し回数 / リトライ）")
+    for name, s in result["stages"].items():
+        print(f"   {name:<24} {s['seconds']:>8.2f}秒 {int(s['calls']):>5}回 {int(s['retries']):>4}回")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--articles", type=int, default=10, help="処理する記事数（デフォルト: 10）")
+    parser.add_argument("--concurrency", type=int, default=2, help="同時に処理する記事数（デフォルト: 2）")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="記事内のAPI呼び出しも並行実行する")
+    parser.add_argument("--stream", action="store_true", help="ストリーミング生成（GEMINI_STREAM=1）で実行する")
+    parser.add_argument("--gemini-rest", action="store_true",
+                        help="代替モデルの代わりに GEMINI_PROVIDER=rest で代替サーバーの Gemini REST API を呼ぶ")
+    parser.add_argument("--verbose", action="store_true", help="パイプラインの進捗表示をそのまま出力する")
+    parser.add_argument("--output", help="結果をJSONで保存するパス（CIでの比較用）")
+    for name in SERVICES:
+        parser.add_argument(f"--{name}-latency", type=float, default=DEFAULT_LATENCY[name],
+                            help=f"{name} の応答遅延（秒、デフォルト: {DEFAULT_LATENCY[name]}）")
+        parser.add_argument(f"--{name}-error-rate", type=float, default=0.0,
+                            help=f"{name} がエラー（503）を返す確率（0〜1）")
+        parser.add_argument(f"--{name}-payload-kb", type=int, default=0,
+                            help=f"{name} の応答サイズ（KB、images は画像サイズ、gemini は記事サイズ）")
+    args = parser.parse_args(argv)
+
+    result = run(args)
+    print_result(result)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    return 0 if result["succeeded"] == result["articles"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
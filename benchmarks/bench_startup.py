@@ -0,0 +1,88 @@
+"""起動時間のベンチマーク（各エントリーポイントの import にかかる時間と、時間のかかっているモジュール）
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --repeat 10 --top 5
+    python benchmarks/bench_startup.py --modules main worker
+
+python -X importtime の結果と、新しいプロセスでの import の実時間（中央値・最小値）を表示する。
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (表示名, 実行するコード)
+SCENARIOS = {
+    "main": "import main",
+    "batch": "import batch",
+    "worker": "import worker",
+    "refresh_affiliate": "import refresh_affiliate",
+    # 初回の生成時に払うコスト（SDK の import と configure）。ネットワークには接続しない
+    "main+sdk": "import main; main.get_provider().model()",
+}
+
+IMPORTTIME_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+def run_python(code, *flags):
+    return subprocess.run(
+        [sys.executable, *flags, "-c", code], cwd=ROOT, capture_output=True, text=True, env=dict(os.environ)
+    )
+
+def import_breakdown(code):
+    """-X importtime の出力を [(モジュール名, 自身のμs, 累積μs, 深さ)] にする"""
+    result = run_python(code, "-X", "importtime")
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    rows = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    return rows
+
+def wall_times(code, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = run_python(code)
+        times.append(time.perf_counter() - started)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return times
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modules", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS), help="計測する対象")
+    parser.add_argument("--repeat", type=int, default=5, help="実時間の計測回数（デフォルト: 5）")
+    parser.add_argument("--top", type=int, default=8, help="表示する時間のかかったモジュール数（デフォルト: 8）")
+    args = parser.parse_args(argv)
+
+    # インタープリター起動時に読み込まれるモジュール（site など）は集計から除く
+    startup_modules = {row[0] for row in import_breakdown("pass")}
+    baseline = statistics.median(wall_times("pass", args.repeat))
+    print(f"Python起動のみ: {baseline * 1000:.0f}ms（以下の実時間はこれを含む）\n")
+    print(f"{'対象':<20} {'import(ms)':>11} {'実時間 中央値(ms)':>18} {'最小(ms)':>10}")
+    details = {}
+    for name in args.modules:
+        code = SCENARIOS[name]
+        rows = [row for row in import_breakdown(code) if row[0] not in startup_modules]
+        times = wall_times(code, args.repeat)
+        import_ms = sum(cumulative for _, _, cumulative, depth in rows if depth == 0) / 1000
+        print(f"{name:<20} {import_ms:>11.0f} {statistics.median(times) * 1000:>18.0f} {min(times) * 1000:>10.0f}")
+        details[name] = rows
+
+    for name, rows in details.items():
+        # 直接 import しているモジュール（深さ0と1）を累積時間の長い順に
+        top = sorted((r for r in rows if r[3] <= 1), key=lambda r: -r[2])[:args.top]
+        print(f"\n[{name}] 時間のかかっているモジュール（累積ms）")
+        for module, _, cumulative, _ in top:
+            print(f"   {module:<40} {cumulative / 1000:>8.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+"""ベンチマーク用のローカル代替サーバー（WordPress REST / Pexels / 画像 / 楽天 / Gemini REST）と Gemini の代替モデル
+
+外部APIを呼ばずにパイプライン全体を動かすためのもの。サービスごとに応答遅延・エラー率・応答サイズを設定できる。
+"""
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+SERVICES = ("wordpress", "pexels", "images", "rakuten", "gemini")
+
+class ServiceProfile:
+    """代替サービス1つ分の挙動
+
+    latency: 応答までの秒数（平均）、jitter: 遅延のばらつき（±割合）、
+    error_rate: 503（Gemini は例外）を返す確率、payload_kb: 応答本文のおおよそのサイズ（0 = 最小限）
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0, payload_kb=0, jitter=0.2):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.payload_kb = payload_kb
+        self.jitter = jitter
+
+    def wait(self):
+        if self.latency > 0:
+            time.sleep(self.latency * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def should_fail(self):
+        return random.random() < self.error_rate
+
+    def padding(self):
+        """JSON応答を payload_kb まで膨らませるための文字列"""
+        return "x" * (self.payload_kb * 1024)
+
+def make_image(size_kb):
+    """size_kb KB 程度のJPEG（Pillowが無ければJPEGヘッダー付きのダミー）"""
+    try:
+        import io
+
+        from PIL import Image
+    except ImportError:
+        return b"\xff\xd8\xff\xe0" + bytes(random.getrandbits(8) for _ in range(size_kb * 1024))
+    # ノイズ画像は圧縮が効かないため、辺の長さでおおよそのサイズを調整する
+    side = max(16, int((size_kb * 1024 / 3) ** 0.5))
+    image = Image.frombytes("RGB", (side, side), random.randbytes(side * side * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=90)
+    return buffer.getvalue()
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "FakeServices/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, payload=None, body=None, content_type="application/json", headers=None):
+        if body is None:
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b";")[0].strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+            return b"".join(chunks)
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def _service(self, path):
+        if path.startswith("/wp-json/"):
+            return "wordpress"
+        if path.startswith("/pexels/"):
+            return "pexels"
+        if path.startswith("/images/"):
+            return "images"
+        if path.startswith("/rakuten/"):
+            return "rakuten"
+        if path.startswith("/gemini/"):
+            return "gemini"
+        return None
+
+    def _handle(self, method):
+        url = urlsplit(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        body = self._read_body() if method in ("POST", "PATCH", "PUT") else b""
+        name = self._service(url.path)
+        if name is None:
+            return self._send(404, {"code": "rest_no_route"})
+        fakes = self.server.fakes
+        profile = fakes.profiles[name]
+        fakes.count(name)
+        profile.wait()
+        if profile.should_fail():
+            return self._send(503, {"code": "service_unavailable"}, headers={"Retry-After": "0"})
+        handler = getattr(fakes, f"handle_{name}")
+        return self._send(*handler(method, url.path, query, body, profile))
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PATCH(self):
+        self._handle("PATCH")
+
+class FakeServices:
+    """全ての代替サービスを1つのローカルHTTPサーバーで提供する
+
+        with FakeServices(profiles) as fakes:
+            os.environ.update(fakes.environ())
+    """
+
+    TERM_PATH_RE = re.compile(r"^/wp-json/wp/v2/(tags|categories)$")
+    POST_PATH_RE = re.compile(r"^/wp-json/wp/v2/posts/(\d+)$")
+
+    def __init__(self, profiles=None, image_kb=200):
+        self.profiles = {name: ServiceProfile() for name in SERVICES}
+        self.profiles.update(profiles or {})
+        self.image = make_image(self.profiles["images"].payload_kb or image_kb)
+        self.terms = {"tags": {}, "categories": {}}
+        self.posts = {}
+        self.requests = dict.fromkeys(SERVICES, 0)
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.fakes = self
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def environ(self):
+        """main.py を代替サーバーに向けるための環境変数"""
+        return {
+            "WP_URL": self.base_url,
+            "WP_USER": "bench",
+            "WP_APP_PASSWORD": "bench",
+            "PEXELS_API_KEY": "bench",
+            "PEXELS_SEARCH_URL": f"{self.base_url}/pexels/v1/search",
+            "RAKUTEN_APP_ID": "bench",
+            "RAKUTEN_AFFILIATE_ID": "bench",
+            "RAKUTEN_SEARCH_URL": f"{self.base_url}/rakuten/IchibaItem/Search/20170706",
+            "GEMINI_API_KEY": "bench",
+            "GEMINI_REST_URL": f"{self.base_url}/gemini/v1beta",
+        }
+
+    def count(self, name):
+        with self._lock:
+            self.requests[name] += 1
+
+    def _new_id(self):
+        with self._lock:
+            self._next_id += 1
+            return self._next_id
+
+    # ------------------------------------------
+    # 各サービスの応答（戻り値は _Handler._send の引数）
+    # ------------------------------------------
+    def handle_wordpress(self, method, path, query, body, profile):
+        match = self.TERM_PATH_RE.match(path)
+        if match:
+            terms = self.terms[match.group(1)]
+            if method == "GET":
+                per_page = int(query.get("per_page", 10))
+                page = int(query.get("page", 1))
+                with self._lock:
+                    items = [{"id": term_id, "name": name} for name, term_id in terms.items()]
+                if "search" in query:
+                    items = [item for item in items if query["search"] in item["name"]]
+                total_pages = max(1, -(-len(items) // per_page))
+                return 200, items[(page - 1) * per_page:page * per_page], None, "application/json", {
+                    "X-WP-Total": str(len(items)), "X-WP-TotalPages": str(total_pages)}
+            name = json.loads(body)["name"]
+            with self._lock:
+                if name in terms:
+                    return 400, {"code": "term_exists", "message": "既に存在します",
+                                 "data": {"status": 400, "term_id": terms[name]}}
+                self._next_id += 1
+                terms[name] = self._next_id
+            return 201, {"id": terms[name], "name": name}
+
+        if path == "/wp-json/wp/v2/media" and method == "POST":
+            media_id = self._new_id()
+            return 201, {"id": media_id, "source_url": f"{self.base_url}/uploads/{media_id}.jpg",
+                         "alt_text": query.get("alt_text", ""), "media_details": {"filesize": len(body)},
+                         "_padding": profile.padding()}
+
+        if path == "/wp-json/wp/v2/posts":
+            if method == "GET":
+                with self._lock:
+                    items = [{"id": p["id"], "title": {"raw": p.get("title", "")}, "content": {"raw": p.get("content", "")},
+                              "modified": p["modified"], "date_gmt": p["modified"], "modified_gmt": p["modified"]}
+                             for p in self.posts.values() if p["modified"] > query.get("modified_after", "")]
+                return 200, items, None, "application/json", {"X-WP-Total": str(len(items)), "X-WP-TotalPages": "1"}
+            post = json.loads(body)
+            post.update(id=self._new_id(), modified=time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime()))
+            with self._lock:
+                self.posts[post["id"]] = post
+            return 201, {"id": post["id"], "link": f"{self.base_url}/?p={post['id']}",
+                         "categories": post.get("categories", []), "tags": post.get("tags", []),
+                         "_padding": profile.padding()}
+
+        match = self.POST_PATH_RE.match(path)
+        if match and int(match.group(1)) in self.posts:
+            with self._lock:
+                post = self.posts[int(match.group(1))]
+                if method != "GET":
+                    post.update(json.loads(body))
+            return 200, {"id": post["id"]}
+        return 404, {"code": "rest_no_route"}
+
+    def handle_pexels(self, method, path, query, body, profile):
+        count = int(query.get("per_page", 15))
+        photos = []
+        for _ in range(count):
+            photo_id = self._new_id()
+            image_url = f"{self.base_url}/images/{photo_id}.jpg"
+            photos.append({"id": photo_id, "alt": query.get("query", ""),
+                           "src": {"original": image_url, "large2x": image_url, "large": image_url}})
+        return 200, {"page": int(query.get("page", 1)), "per_page": count, "photos": photos,
+                     "_padding": profile.padding()}
+
+    def handle_images(self, method, path, query, body, profile):
+        return 200, None, self.image, "image/jpeg"
+
+    def handle_rakuten(self, method, path, query, body, profile):
+        keyword = query.get("keyword", "")
+        items = [{"Item": {
+            "itemName": f"{keyword} おすすめ商品{i + 1}",
+            "itemPrice": 1980 * (i + 1),
+            "itemUrl": f"https://item.rakuten.co.jp/bench/{i}/",
+            "affiliateUrl": f"https://hb.afl.rakuten.co.jp/bench/{i}/",
+            "mediumImageUrls": [{"imageUrl": f"{self.base_url}/images/rakuten_{i}.jpg"}],
+            "shopName": "ベンチマーク店",
+            "reviewCount": 100 - i,
+            "itemCaption": profile.padding(),
+        }} for i in range(int(query.get("hits", 3)))]
+        return 200, {"count": len(items), "Items": items}
+
+    def handle_gemini(self, method, path, query, body, profile):
+        """Gemini REST API（generateContent / streamGenerateContent?alt=sse / countTokens / cachedContents）"""
+        if path.endswith(":countTokens"):
+            return 200, {"totalTokens": len(json.dumps(json.loads(body)["contents"], ensure_ascii=False)) // 2}
+        if path.endswith("/cachedContents") and method == "POST":
+            return 200, {"name": f"cachedContents/bench-{self._new_id()}"}
+        if "/cachedContents/" in path:
+            return 200, {"name": path.split("/v1beta/", 1)[1]}
+        if not path.endswith(("generateContent", "streamGenerateContent")):
+            return 404, {"error": {"code": 404, "status": "NOT_FOUND"}}
+        request = json.loads(body)
+        prompt_tokens = len(json.dumps(request["contents"], ensure_ascii=False)) // 2
+        article = make_article_text(profile.payload_kb or 8)
+        usage = {"promptTokenCount": prompt_tokens, "candidatesTokenCount": len(article) // 2,
+                 "totalTokenCount": prompt_tokens + len(article) // 2}
+
+        def chunk(text, with_usage):
+            data = {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}]}
+            if with_usage:
+                data["usageMetadata"] = usage
+            return data
+
+        if path.endswith(":generateContent"):
+            return 200, chunk(article, True)
+        pieces = [article[i:i + 400] for i in range(0, len(article), 400)]
+        events = "".join(
+            f"data: {json.dumps(chunk(piece, i == len(pieces) - 1), ensure_ascii=False)}\r\n\r\n"
+            for i, piece in enumerate(pieces)
+        )
+        return 200, None, events.encode("utf-8"), "text/event-stream"
+
+# ==========================================
+# Gemini の代替モデル
+# ==========================================
+class FakeUsage:
+    def __init__(self, prompt_token_count, candidates_token_count):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+        self.total_token_count = prompt_token_count + candidates_token_count
+
+class FakeResponse:
+    def __init__(self, text, usage=None):
+        self.text = text
+        self.usage_metadata = usage
+
+ARTICLE_CHARS = "あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよらりるれろわん"
+
+def make_article_text(size_kb):
+    """main.parse_article が受け付ける形式（タイトル / 要約 / 本文）の記事
+
+    呼び出しごとに本文の文字列をランダムに変え、記事どうしが近似重複と判定されないようにする。
+    """
+    def paragraph():
+        return "".join(random.choices(ARTICLE_CHARS, k=120)) + "。整体院の現場で多くの患者さんを見てきた経験からお話しします。"
+    section_bytes = len(f"<h2>所長Mが解説する原因</h2><p>{paragraph()}</p>".encode("utf-8"))
+    sections = max(3, size_kb * 1024 // section_bytes)
+    body = "".join(f"<h2>所長Mが解説する原因</h2><p>{paragraph()}</p>" for _ in range(sections))
+    half = len(body) // 2
+    return (
+        "【所長M監修】ベンチマーク用の記事タイトル\n[[DELIMITER]]\n"
+        + "整体院の所長Mが原因と対策をわかりやすく解説します。" * 3
+        + "\n[[DELIMITER]]\n"
+        + body[:half] + "[[AFFILIATE_AREA]]" + body[half:]
+    )
+
+class FakeModel:
+    """genai.GenerativeModel の代わり（generate_content のみ、stream=True にも対応）"""
+
+    model_name = "models/fake-bench"
+
+    def __init__(self, profile=None, chunk_chars=400):
+        self.profile = profile or ServiceProfile()
+        self.chunk_chars = chunk_chars
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        with self._lock:
+            self.calls += 1
+        text = make_article_text(self.profile.payload_kb or 8)
+        usage = FakeUsage(len(str(contents)) // 2, len(text) // 2)
+        if self.profile.should_fail():
+            self.profile.wait()
+            raise RuntimeError("503 The model is overloaded (fake)")
+        if not stream:
+            self.profile.wait()
+            return FakeResponse(text, usage)
+        return self._stream(text, usage)
+
+    def _stream(self, text, usage):
+        chunks = [text[i:i + self.chunk_chars] for i in range(0, len(text), self.chunk_chars)]
+        delay = self.profile.latency / len(chunks)
+        for i, chunk in enumerate(chunks):
+            time.sleep(delay)
+            yield FakeResponse(chunk, usage if i == len(chunks) - 1 else None)
@@ -0,0 +1,195 @@
+import html
+import os
+import random
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from datetime import datetime, timezone
+
+import http_client
+from term_cache import CACHE_DIR, load_json, save_json
+
+# ==========================================
+# 投稿済み・下書き記事の類似検索インデックス（MinHash + LSH）
+# ==========================================
+CONTENT_INDEX_PATH = os.path.join(CACHE_DIR, "content_index.json")
+CONTENT_INDEX_SYNC_INTERVAL = int(os.environ.get("CONTENT_INDEX_SYNC_INTERVAL", "3600"))  # 秒（WordPressとの差分同期の間隔）
+POST_STATUSES = "publish,future,draft,pending,private"
+# modified_after はサイトのタイムゾーンで解釈されるため、1日分さかのぼって取得する（同じ投稿の再取得は上書きになるだけ）
+SYNC_OVERLAP = 24 * 3600
+
+SHINGLE_SIZE = 5    # 文字 n-gram（日本語は単語区切りが無いため文字単位）
+NUM_PERM = 128      # MinHash の署名の長さ
+BANDS = 32          # LSH のバンド数（1バンド = NUM_PERM / BANDS 行）。類似度およそ 0.4 以上が候補になる
+ROWS = NUM_PERM // BANDS
+
+_MERSENNE = (1 << 61) - 1
+_EMPTY = _MERSENNE
+# 署名はディスクに保存するため、ハッシュ関数の係数は固定シードで作る
+_rng = random.Random(20240601)
+_HASH_A, _HASH_B = _rng.randrange(1, _MERSENNE), _rng.randrange(0, _MERSENNE)
+# 署名の形式か商材の判定方法を変えたら上げる（既存のインデックスは作り直される）
+INDEX_VERSION = f"oph-{SHINGLE_SIZE}-{NUM_PERM}-{BANDS}.2"
+
+TAG_RE = re.compile(r"<[^>]*>")
+
+def normalize(text):
+    """HTMLタグ・文字参照・空白・記号を除き、全角半角と大文字小文字を揃える"""
+    text = unicodedata.normalize("NFKC", html.unescape(TAG_RE.sub(" ", text))).lower()
+    return "".join(ch for ch in text if ch.isalnum())
+
+def signature(text):
+    """正規化済みテキストの文字シングルの MinHash 署名
+
+    NUM_PERM 個のハッシュ関数を使う代わりに、1回のハッシュ値をビンに振り分けてビンごとの最小値を取る
+    （One Permutation Hashing）。シングル数に比例する計算量で済み、数千字の記事でも数ms で終わる。
+    空のビンは右隣の空でないビンの値で埋める（densification）。
+    """
+    bins = [_EMPTY] * NUM_PERM
+    shingles = {text[i:i + SHINGLE_SIZE] for i in range(max(1, len(text) - SHINGLE_SIZE + 1))}
+    for shingle in shingles:
+        h = (_HASH_A * zlib.crc32(shingle.encode("utf-8")) + _HASH_B) % _MERSENNE
+        slot, value = h % NUM_PERM, h // NUM_PERM
+        if value < bins[slot]:
+            bins[slot] = value
+    if _EMPTY in bins and len(set(bins)) > 1:
+        original = list(bins)
+        for slot in range(NUM_PERM):
+            if original[slot] == _EMPTY:
+                distance = next(d for d in range(1, NUM_PERM) if original[(slot + d) % NUM_PERM] != _EMPTY)
+                # 元の値と区別できるよう、借りた値と距離を _EMPTY より大きい値に符号化する
+                bins[slot] = _EMPTY + original[(slot + distance) % NUM_PERM] * NUM_PERM + distance
+    return bins
+
+def similarity(sig_a, sig_b):
+    """署名から推定した Jaccard 類似度"""
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / NUM_PERM
+
+def _band_keys(sig):
+    return [(band, *sig[band * ROWS:(band + 1) * ROWS]) for band in range(BANDS)]
+
+def _parse_gmt(value):
+    try:
+        return datetime.fromisoformat(value).replace(tzinfo=timezone.utc).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+class ContentIndex:
+    """記事ごとの MinHash 署名・商材ID・日時を保持し、近似重複の検索と商材ごとの最終投稿日時を返す
+
+    WordPress からは更新日時（modified_gmt）以降の投稿だけを差分で取得する。
+    検索は LSH のバケットで候補を絞ってから署名を比較するため、記事数が数千件でも1ms未満で終わる。
+    """
+
+    def __init__(self, wp_url, auth, path=CONTENT_INDEX_PATH, sync_interval=CONTENT_INDEX_SYNC_INTERVAL, find_product_id=None):
+        self.wp_url = wp_url
+        self.auth = auth
+        # 本文から商材IDを返す関数（アフィリエイト枠の形式は main.py が持つ）
+        self.find_product_id = find_product_id or (lambda content: None)
+        self.path = path
+        self.sync_interval = sync_interval
+        self._lock = threading.RLock()
+        self._data = load_json(path, {})
+        if self._data.get("version") != INDEX_VERSION:
+            # 署名の形式が変わった場合は作り直す
+            self._data = {"version": INDEX_VERSION, "docs": {}, "synced_at": 0, "last_modified": None}
+        self._buckets = {}
+        self._covered = {}
+        for doc_id, doc in self._data["docs"].items():
+            self._index(doc_id, doc)
+
+    def __len__(self):
+        return len(self._data["docs"])
+
+    def _index(self, doc_id, doc):
+        for key in _band_keys(doc["sig"]):
+            self._buckets.setdefault(key, set()).add(doc_id)
+        product_id, date = doc.get("product_id"), doc.get("date")
+        if product_id and date and date > self._covered.get(product_id, 0):
+            self._covered[product_id] = date
+
+    def _unindex(self, doc_id):
+        doc = self._data["docs"].get(doc_id)
+        if doc:
+            for key in _band_keys(doc["sig"]):
+                self._buckets.get(key, set()).discard(doc_id)
+
+    def _put(self, doc_id, title, content, product_id=None, date=None):
+        doc = {
+            "title": title,
+            "product_id": product_id or self.find_product_id(content),
+            "date": date or time.time(),
+            "sig": signature(normalize(f"{title} {content}")),
+        }
+        self._unindex(doc_id)
+        self._data["docs"][doc_id] = doc
+        self._index(doc_id, doc)
+
+    def add(self, doc_id, title, content, product_id=None, date=None):
+        """生成・投稿した記事をインデックスに追加（doc_id は WordPress の投稿ID）"""
+        with self._lock:
+            self._put(str(doc_id), title, content, product_id, date)
+            save_json(self.path, self._data)
+
+    def sync(self, force=False):
+        """前回以降に更新された投稿を WordPress から取得してインデックスに反映し、取得件数を返す"""
+        with self._lock:
+            if not force and time.time() - self._data["synced_at"] < self.sync_interval:
+                return 0
+            last_modified = self._data["last_modified"]
+        params = {
+            "context": "edit",
+            "_fields": "id,title,content,date_gmt,modified_gmt",
+            "status": POST_STATUSES,
+            "orderby": "modified",
+            "order": "asc",
+            "per_page": 100,
+        }
+        if last_modified:
+            since = datetime.fromtimestamp(last_modified - SYNC_OVERLAP, timezone.utc)
+            params["modified_after"] = since.strftime("%Y-%m-%dT%H:%M:%S")
+        count, page, total_pages = 0, 1, 1
+        latest = last_modified
+        while page <= total_pages:
+            res = http_client.get(f"{self.wp_url}/wp-json/wp/v2/posts", params=dict(params, page=page), auth=self.auth)
+            if res.status_code != 200:
+                print(f"   ⚠️ 投稿一覧の取得失敗: {res.status_code}")
+                return count
+            posts = res.json()
+            with self._lock:
+                for post in posts:
+                    title = (post.get("title") or {}).get("raw", "")
+                    content = (post.get("content") or {}).get("raw", "")
+                    self._put(str(post["id"]), title, content, date=_parse_gmt(post.get("date_gmt")))
+                    latest = max(filter(None, [latest, _parse_gmt(post.get("modified_gmt"))]), default=None)
+            count += len(posts)
+            total_pages = int(res.headers.get("X-WP-TotalPages", 1))
+            page += 1
+        with self._lock:
+            self._data["synced_at"] = time.time()
+            self._data["last_modified"] = latest
+            save_json(self.path, self._data)
+        return count
+
+    def find_similar(self, title, content, threshold):
+        """類似度が threshold 以上の既存記事のうち最も近いものを (doc_id, 類似度, タイトル) で返す（なければ None）"""
+        return self.find_similar_signature(signature(normalize(f"{title} {content}")), threshold)
+
+    def find_similar_signature(self, sig, threshold):
+        with self._lock:
+            candidates = set()
+            for key in _band_keys(sig):
+                candidates |= self._buckets.get(key, set())
+            best = None
+            for doc_id in candidates:
+                score = similarity(sig, self._data["docs"][doc_id]["sig"])
+                if score >= threshold and (best is None or score > best[1]):
+                    best = (doc_id, score, self._data["docs"][doc_id]["title"])
+            return best
+
+    def last_covered(self, product_id):
+        """商材の記事が最後に作成された日時（UNIX秒、なければ None）"""
+        with self._lock:
+            return self._covered.get(product_id)
@@ -0,0 +1,73 @@
+import hashlib
+import os
+import threading
+import time
+
+from term_cache import CACHE_DIR, load_json, save_json
+
+# ==========================================
+# Gemini 生成結果の保存（再実行・リトライ時に再利用）
+# ==========================================
+GENERATION_CACHE_DIR = os.path.join(CACHE_DIR, "generations")
+CONTEXT_CACHE_PATH = os.path.join(CACHE_DIR, "gemini_context.json")
+
+def make_key(prompt, model_name, product_id):
+    """プロンプト・モデル名・商材IDから生成結果のキーを作成"""
+    digest = hashlib.sha256(f"{model_name}\n{product_id}\n{prompt}".encode("utf-8")).hexdigest()
+    return f"{product_id}-{digest[:32]}"
+
+class GenerationStore:
+    """生成結果（生レスポンスとパース済みのタイトル・要約・本文）をキーごとに1ファイルで保存する
+
+    投稿に成功した生成結果は post_id を記録し、以降は再利用しない（同じ記事の重複投稿を防ぐ）。
+    """
+
+    def __init__(self, directory=GENERATION_CACHE_DIR, context_path=CONTEXT_CACHE_PATH):
+        self.directory = directory
+        self.context_path = context_path
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def load(self, key):
+        return load_json(self._path(key), None)
+
+    def find_reusable(self, key):
+        """まだ投稿されていない生成結果を返す（なければ None）"""
+        entry = self.load(key)
+        if entry and not entry.get("post_id"):
+            return entry
+        return None
+
+    def save(self, key, model_name, product_id, prompt, raw, article):
+        save_json(self._path(key), {
+            "key": key,
+            "model": model_name,
+            "product_id": product_id,
+            "prompt_sha256": hashlib.sha256(prompt.encode("utf-8")).hexdigest(),
+            "created_at": time.time(),
+            "raw": raw,
+            "article": article,
+            "post_id": None,
+        })
+
+    def mark_posted(self, key, post_id):
+        with self._lock:
+            entry = self.load(key)
+            if entry:
+                entry["post_id"] = post_id
+                save_json(self._path(key), entry)
+
+    def find_context(self, system_sha256):
+        """有効期限内の Gemini コンテキストキャッシュ名を返す"""
+        entry = load_json(self.context_path, {}).get(system_sha256)
+        if entry and entry["expires_at"] > time.time() + 60:
+            return entry["name"]
+        return None
+
+    def save_context(self, system_sha256, name, expires_at):
+        with self._lock:
+            data = load_json(self.context_path, {})
+            data[system_sha256] = {"name": name, "expires_at": expires_at}
+            save_json(self.context_path, data)
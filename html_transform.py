@@ -0,0 +1,58 @@
+import re
+
+# ==========================================
+# 記事HTMLの変換（クリーンアップ・画像挿入・アフィリエイト枠）
+# ==========================================
+# 固定文字列の除去は str.replace で行う（正規表現で1文字ずつ走査するより速い）。
+# 生成結果にはほとんど含まれないため、共通部分が見つかった場合だけ置換する
+ESCAPES = {"\\": ("\\n", "\\t"), "¥": ("¥n", "¥t"), "\n": ("\n",), "\t": ("\t",)}  # 空白に置換
+REMOVALS = {
+    "SEOタイトル": ("SEOタイトル:", "SEOタイトル："),
+    "メタディスクリプション": ("メタディスクリプション:", "メタディスクリプション："),
+    "記事本文": ("記事本文:", "記事本文："),
+    "```": ("```html", "```"),
+}
+# "#" を消さないタグ（CSSカラーやリンクのアンカー）とコメント
+HASH_PROTECTED_RE = re.compile(r"(<!--.*?-->|</?[A-Za-z][^<>#]*#[^<>]*>)", re.S)
+
+def _strip_hashes(text):
+    """テキスト中のマークダウン記号の "#" を消す（文字参照 &#12354; の "#" は残す）"""
+    return "&#".join(part.replace("#", "") for part in text.split("&#"))
+
+def clean_html(html):
+    """生成結果のエスケープ文字・マークダウン記号・見出しラベル・コードブロックを除去
+
+    "#" はテキスト中のマークダウン記号だけを消し、文字参照（&#12354;）やタグ内のCSSカラー（#c9b99a）は残す。
+    """
+    for marker, escapes in ESCAPES.items():
+        if marker in html:
+            for escape in escapes:
+                html = html.replace(escape, " ")
+    for marker, removals in REMOVALS.items():
+        if marker in html:
+            for removal in removals:
+                html = html.replace(removal, "")
+    if "#" in html:
+        # 分割結果は テキスト / 保護するタグ / テキスト ... の順に並ぶ
+        parts = HASH_PROTECTED_RE.split(html)
+        parts[::2] = [_strip_hashes(part) for part in parts[::2]]
+        html = "".join(parts)
+    return html
+
+def insert_after(html, tag_name, fragments):
+    """指定タグの終了タグの直後に、HTML断片を先頭から1つずつ挿入し (HTML, 挿入数) を返す（h2の後に画像など）"""
+    if not fragments:
+        return html, 0
+    remaining = iter(fragments)
+    return re.subn(rf"</{tag_name}\s*>", lambda m: m.group() + next(remaining), html,
+                   count=len(fragments), flags=re.I)
+
+def replace_placeholder(html, placeholder, replacement):
+    """プレースホルダーを置換し、見つからなければ末尾に追加（アフィリエイト枠）"""
+    if placeholder in html:
+        return html.replace(placeholder, replacement)
+    return html + replacement
+
+def clean_text(text):
+    """生成結果のクリーンアップ（タイトル・要約・本文共通）"""
+    return clean_html(text.strip()).strip()
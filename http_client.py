@@ -0,0 +1,154 @@
+import email.utils
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import instrumentation
+
+# ==========================================
+# 共通HTTPクライアント（接続プール・タイムアウト・リトライ）
+# ==========================================
+CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", "60"))
+MAX_RETRIES = int(os.environ.get("HTTP_MAX_RETRIES", "4"))
+BACKOFF_BASE = 0.5   # 秒（1回目の待機の上限）
+BACKOFF_MAX = 30.0   # 秒（1回あたりの待機の上限）
+POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", "10"))
+
+# 429 / 502-504 はサーバー側で処理されていないため、POST でも再送する
+RETRY_STATUSES = {429, 502, 503, 504}
+# 500 や読み取りタイムアウトは処理済みの可能性があるため、冪等なメソッドだけ再送する
+IDEMPOTENT_RETRY_STATUSES = RETRY_STATUSES | {500}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+_stats = defaultdict(lambda: {"requests": 0, "errors": 0, "retries": 0, "seconds": 0.0})
+_stats_lock = threading.Lock()
+
+def get_session(host):
+    """ホストごとのキープアライブ接続プール付きセッション"""
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[host] = session
+        return session
+
+def _record(host, seconds, error=False, retry=False, response=None):
+    with _stats_lock:
+        s = _stats[host]
+        s["requests"] += 1
+        s["seconds"] += seconds
+        s["errors"] += int(error)
+        s["retries"] += int(retry)
+    # 実行中の処理段階（instrumentation.stage）にも転送量・ステータスを加算
+    if response is None:
+        instrumentation.record_http(None, retry=retry)
+    else:
+        instrumentation.record_http(response.status_code, *_transfer_sizes(response), retry=retry)
+
+def _transfer_sizes(response):
+    """(送信バイト数, 受信バイト数)。ストリームの場合は Content-Length ヘッダーの値を使う"""
+    request = response.request
+    body = request.body
+    if isinstance(body, bytes):
+        sent = len(body)
+    elif isinstance(body, str):
+        sent = len(body.encode("utf-8"))
+    else:
+        sent = int(request.headers.get("Content-Length") or 0)
+    if response._content_consumed:
+        received = len(response.content or b"")
+    else:
+        received = int(response.headers.get("Content-Length") or 0)
+    return sent, received
+
+def _retry_after(response):
+    """Retry-After ヘッダー（秒数 or HTTP日付）を待機秒数に変換"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def _backoff(attempt):
+    """指数バックオフ + フルジッター"""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+def _is_replayable(data):
+    return data is None or isinstance(data, (bytes, str, dict, list, tuple))
+
+def request(method, url, retries=None, **kwargs):
+    """タイムアウト付きでリクエストし、429/5xx・通信エラー時はバックオフして再送する
+
+    ストリーム（ジェネレーターやファイル）を送る場合は再送できないため、リトライしない。
+    """
+    method = method.upper()
+    host = urlsplit(url).netloc
+    session = get_session(host)
+    kwargs.setdefault("timeout", (CONNECT_TIMEOUT, READ_TIMEOUT))
+    if retries is None:
+        retries = MAX_RETRIES if _is_replayable(kwargs.get("data")) else 0
+    idempotent = method in IDEMPOTENT_METHODS
+    retry_statuses = IDEMPOTENT_RETRY_STATUSES if idempotent else RETRY_STATUSES
+
+    attempt = 0
+    while True:
+        started = time.monotonic()
+        try:
+            response = session.request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            # 接続確立前のタイムアウトはどのメソッドでも再送できる
+            can_retry = idempotent or isinstance(e, requests.ConnectTimeout)
+            _record(host, time.monotonic() - started, error=True, retry=attempt > 0)
+            if attempt >= retries or not can_retry:
+                raise
+            wait = _backoff(attempt)
+            print(f"   🔁 {host} 通信エラーのため {wait:.1f}秒後に再試行 ({attempt + 1}/{retries}): {e}")
+        else:
+            elapsed = time.monotonic() - started
+            failed = response.status_code in retry_statuses
+            _record(host, elapsed, error=failed, retry=attempt > 0, response=response)
+            if not failed or attempt >= retries:
+                return response
+            wait = _retry_after(response)
+            if wait is None:
+                wait = _backoff(attempt)
+            wait = min(wait, BACKOFF_MAX)
+            print(f"   🔁 {host} {response.status_code} のため {wait:.1f}秒後に再試行 ({attempt + 1}/{retries})")
+            response.close()
+        time.sleep(wait)
+        attempt += 1
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+def stats():
+    """ホストごとの リクエスト数・エラー数・リトライ数・合計時間"""
+    with _stats_lock:
+        return {host: dict(s) for host, s in _stats.items()}
+
+def print_stats():
+    print("📡 HTTP統計（ホスト別）")
+    for host, s in sorted(stats().items()):
+        avg_ms = s["seconds"] / s["requests"] * 1000 if s["requests"] else 0
+        print(f"   {host}: {s['requests']}件 / 平均{avg_ms:.0f}ms / リトライ{s['retries']}回 / エラー{s['errors']}件")
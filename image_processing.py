@@ -0,0 +1,82 @@
+import atexit
+import importlib.util
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# ==========================================
+# アップロード前の画像変換（縮小・WebP/AVIF化・EXIF削除）
+# ==========================================
+IMAGE_FORMAT = os.environ.get("IMAGE_FORMAT", "").lower()   # webp / avif（空なら変換しない）
+IMAGE_MAX_WIDTH = int(os.environ.get("IMAGE_MAX_WIDTH", "1200"))
+IMAGE_QUALITY = int(os.environ.get("IMAGE_QUALITY", "80"))
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", "0")) or None  # 0 = CPU数
+
+# 形式名 → (Pillowの形式名, Content-Type, 拡張子)
+FORMATS = {
+    "webp": ("WEBP", "image/webp", "webp"),
+    "avif": ("AVIF", "image/avif", "avif"),
+}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def is_enabled():
+    """変換が有効か（形式が指定され、Pillow が使える場合のみ）"""
+    if IMAGE_FORMAT and IMAGE_FORMAT not in FORMATS:
+        print(f"   ⚠️ 未対応の画像形式です: {IMAGE_FORMAT}")
+        return False
+    # Pillow 未インストール時は変換せずにそのままアップロード（import は変換時まで遅らせる）
+    return bool(IMAGE_FORMAT) and importlib.util.find_spec("PIL") is not None
+
+def transcode(data, fmt=IMAGE_FORMAT, max_width=IMAGE_MAX_WIDTH, quality=IMAGE_QUALITY):
+    """画像を縮小して指定形式に再エンコードし、(バイト列, Content-Type, 拡張子) を返す
+
+    EXIF は向きを反映したうえで破棄する。変換できない場合は None。
+    """
+    from PIL import Image, ImageOps
+
+    pil_format, content_type, ext = FORMATS[fmt]
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img = ImageOps.exif_transpose(img)
+            if img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+            if max_width and img.width > max_width:
+                height = round(img.height * max_width / img.width)
+                img = img.resize((max_width, height), Image.LANCZOS)
+            out = io.BytesIO()
+            img.save(out, pil_format, quality=quality)
+            return out.getvalue(), content_type, ext
+    except Exception:
+        return None
+
+def _get_pool():
+    """変換用のプロセスプール（初回呼び出し時に作成）
+
+    アップロード用のスレッドから作成されるため、fork ではなく forkserver（使えない環境では spawn）で起動する。
+    fork だと他のスレッドが保持中のロック（import・標準出力・HTTP統計など）ごと複製され、子プロセスが止まることがある。
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context(method))
+            atexit.register(shutdown)
+        return _pool
+
+def shutdown():
+    """プロセスプールを終了（終了時に自動で呼ばれる）"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+def transcode_many(blobs):
+    """複数画像をプロセスプールで並列に変換（順序は入力と同じ、失敗した画像は None）"""
+    if not blobs:
+        return []
+    return list(_get_pool().map(transcode, blobs))
@@ -0,0 +1,174 @@
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+
+# ==========================================
+# 処理段階ごとの計測（所要時間・転送量・リトライ・HTTPステータス・トークン数）
+# ==========================================
+RUN_ID = uuid.uuid4().hex[:12]
+
+# {run_id} は実行ごとのIDに置き換える（実行ごとに別ファイル）。.cache は実行間で引き継がれるため、その外に出す
+RUN_REPORT_PATH = os.environ.get("RUN_REPORT", os.path.join("reports", "run_report_{run_id}.jsonl")).format(run_id=RUN_ID)
+PROMETHEUS_TEXTFILE = os.environ.get("PROMETHEUS_TEXTFILE")  # node_exporter の textfile collector 用（任意）
+
+_current_stage = contextvars.ContextVar("current_stage", default=None)
+_labels = contextvars.ContextVar("labels", default={})
+_records = []
+_lock = threading.Lock()
+
+def set_labels(**labels):
+    """以降の計測結果に付けるラベル（商材IDなど）を設定"""
+    _labels.set({**_labels.get(), **labels})
+
+def bind(fn):
+    """現在のラベル・計測中の段階を引き継いで fn を実行する関数を返す（スレッドプールに渡す用）"""
+    context = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        return context.copy().run(fn, *args, **kwargs)
+    return wrapper
+
+def stage(name, ok=bool):
+    """関数の呼び出しを1段階として計測するデコレーター
+
+    ok(戻り値) が偽の場合は失敗として記録する。既定では None / 空を失敗とする（このリポジトリの関数は失敗時に None や [] を返すため）。
+    タプルやリストの中身で成否が決まる関数は ok を指定する。
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            record = {
+                "run_id": RUN_ID,
+                "stage": name,
+                **_labels.get(),
+                "started_at": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+                "seconds": 0.0,
+                "ok": False,
+                "requests": 0,
+                "http_status": [],
+                "retries": 0,
+                "bytes_sent": 0,
+                "bytes_received": 0,
+                "prompt_tokens": 0,
+                "output_tokens": 0,
+                "error": None,
+            }
+            token = _current_stage.set(record)
+            started = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+                record["ok"] = bool(ok(result))
+                return result
+            except Exception as e:
+                record["error"] = f"{type(e).__name__}: {e}"
+                raise
+            finally:
+                record["seconds"] = round(time.perf_counter() - started, 4)
+                _current_stage.reset(token)
+                _finish(record)
+        return wrapper
+    return decorator
+
+def record_http(status, bytes_sent=0, bytes_received=0, retry=False):
+    """HTTPリクエスト1回分を計測中の段階に加算（http_client から呼ばれる）"""
+    record = _current_stage.get()
+    if record is None:
+        return
+    with _lock:
+        record["requests"] += 1
+        record["http_status"].append(status)
+        record["retries"] += int(retry)
+        record["bytes_sent"] += bytes_sent
+        record["bytes_received"] += bytes_received
+
+def record_tokens(usage):
+    """Gemini の usage_metadata から入力・出力トークン数を加算"""
+    record = _current_stage.get()
+    if record is None or usage is None:
+        return
+    with _lock:
+        record["prompt_tokens"] += getattr(usage, "prompt_token_count", 0) or 0
+        record["output_tokens"] += getattr(usage, "candidates_token_count", 0) or 0
+
+def _finish(record):
+    with _lock:
+        _records.append(record)
+        if RUN_REPORT_PATH:
+            try:
+                os.makedirs(os.path.dirname(RUN_REPORT_PATH) or ".", exist_ok=True)
+                with open(RUN_REPORT_PATH, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            except OSError as e:
+                print(f"   ⚠️ 計測レポートの書き込みエラー: {e}")
+
+def summarize():
+    """段階ごとの集計 {段階名: {calls, errors, seconds, max_seconds, retries, bytes_sent, bytes_received, prompt_tokens, output_tokens}}"""
+    summary = defaultdict(lambda: defaultdict(float))
+    with _lock:
+        for r in _records:
+            s = summary[r["stage"]]
+            s["calls"] += 1
+            s["errors"] += 0 if r["ok"] else 1
+            s["seconds"] += r["seconds"]
+            s["max_seconds"] = max(s["max_seconds"], r["seconds"])
+            for key in ("retries", "bytes_sent", "bytes_received", "prompt_tokens", "output_tokens"):
+                s[key] += r[key]
+    return {stage: dict(s) for stage, s in summary.items()}
+
+def print_summary():
+    print("⏱️ 段階別の計測結果")
+    for name, s in summarize().items():
+        transferred = (s["bytes_sent"] + s["bytes_received"]) / 1024
+        tokens = f" / トークン {int(s['prompt_tokens'])}+{int(s['output_tokens'])}" if s["prompt_tokens"] or s["output_tokens"] else ""
+        print(f"   {name}: {int(s['calls'])}回 / 合計{s['seconds']:.2f}秒 (最大{s['max_seconds']:.2f}秒) / "
+              f"{transferred:.0f}KB / リトライ{int(s['retries'])}回 / 失敗{int(s['errors'])}回{tokens}")
+
+# (メトリクス名, 説明, [(集計キー, 追加ラベル)])
+PROMETHEUS_METRICS = [
+    ("affiliate_stage_calls", "Stage invocations in the last run.", [("calls", "")]),
+    ("affiliate_stage_errors", "Failed stage invocations in the last run.", [("errors", "")]),
+    ("affiliate_stage_seconds", "Wall time spent in each stage in the last run.", [("seconds", "")]),
+    ("affiliate_stage_max_seconds", "Slowest single invocation of each stage in the last run.", [("max_seconds", "")]),
+    ("affiliate_stage_retries", "HTTP retries per stage in the last run.", [("retries", "")]),
+    ("affiliate_stage_bytes", "Bytes transferred per stage in the last run.",
+     [("bytes_sent", ',direction="sent"'), ("bytes_received", ',direction="received"')]),
+    ("affiliate_stage_tokens", "Gemini tokens per stage in the last run.",
+     [("prompt_tokens", ',kind="prompt"'), ("output_tokens", ',kind="output"')]),
+]
+
+def write_prometheus(path=PROMETHEUS_TEXTFILE):
+    """集計結果を Prometheus の textfile 形式で書き出す（値は直近の実行分なので gauge。_total は counter 用のため付けない）"""
+    if not path:
+        return
+    summary = sorted(summarize().items())
+    lines = []
+    for metric, description, series in PROMETHEUS_METRICS:
+        lines += [f"# HELP {metric} {description}", f"# TYPE {metric} gauge"]
+        for name, s in summary:
+            for key, extra_labels in series:
+                lines.append(f'{metric}{{stage="{name}"{extra_labels}}} {s[key]:g}')
+    lines += [
+        "# HELP affiliate_last_run_timestamp_seconds Unix time the last run finished.",
+        "# TYPE affiliate_last_run_timestamp_seconds gauge",
+        f"affiliate_last_run_timestamp_seconds {time.time():.0f}",
+    ]
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, path)
+
+def finish_run():
+    """実行終了時の集計表示と Prometheus 出力"""
+    print_summary()
+    try:
+        write_prometheus()
+    except OSError as e:
+        print(f"   ⚠️ Prometheus出力エラー: {e}")
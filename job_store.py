@@ -0,0 +1,175 @@
+import json
+import os
+import random
+import sqlite3
+import time
+from contextlib import closing
+
+from term_cache import CACHE_DIR
+
+# ==========================================
+# 記事ジョブの永続キュー（段階ごとの結果を保存して途中から再開）
+# ==========================================
+JOB_DB_PATH = os.path.join(CACHE_DIR, "jobs.sqlite3")
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "5"))
+JOB_BACKOFF_BASE = float(os.environ.get("JOB_BACKOFF_BASE", "30"))   # 秒（1回目の再試行までの待機の目安）
+JOB_BACKOFF_MAX = float(os.environ.get("JOB_BACKOFF_MAX", "1800"))   # 秒
+JOB_LEASE_SECONDS = int(os.environ.get("JOB_LEASE_SECONDS", "1800"))  # 実行中のまま放置されたジョブを再取得するまでの秒数
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    product_id TEXT NOT NULL,
+    category TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',  -- pending / running / done / failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_run_at REAL NOT NULL DEFAULT 0,
+    lease_until REAL,
+    post_id INTEGER,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, next_run_at);
+CREATE TABLE IF NOT EXISTS stages (
+    job_id INTEGER NOT NULL REFERENCES jobs (id),
+    stage TEXT NOT NULL,
+    output TEXT NOT NULL,
+    completed_at REAL NOT NULL,
+    PRIMARY KEY (job_id, stage)
+);
+"""
+
+class JobStore:
+    """記事1本 = ジョブ1件として、状態と段階ごとの出力（タグID・生成記事・メディアID・楽天商品・投稿ID）を SQLite に保存する
+
+    複数スレッド・複数プロセスから使えるよう、操作ごとに接続を開く。
+    実行中のまま lease_until を過ぎたジョブ（プロセスが落ちた・Actions がタイムアウトした）は再取得の対象になる。
+    """
+
+    def __init__(self, path=JOB_DB_PATH, max_attempts=JOB_MAX_ATTEMPTS, lease_seconds=JOB_LEASE_SECONDS):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def enqueue(self, product_id, category):
+        """ジョブを追加してIDを返す。同じ商材の未完了ジョブがあれば、それを返す"""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE product_id = ? AND status IN ('pending', 'running')", (product_id,)
+            ).fetchone()
+            if row:
+                conn.execute("COMMIT")
+                return row["id"]
+            job_id = conn.execute(
+                "INSERT INTO jobs (product_id, category, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                (product_id, category, now, now),
+            ).lastrowid
+            conn.execute("COMMIT")
+            return job_id
+
+    def claim(self):
+        """実行可能なジョブを1件取り出して running にする（なければ None）"""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                """SELECT * FROM jobs
+                   WHERE (status = 'pending' AND next_run_at <= ?) OR (status = 'running' AND lease_until < ?)
+                   ORDER BY next_run_at, id LIMIT 1""",
+                (now, now),
+            ).fetchone()
+            if row:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', lease_until = ?, updated_at = ? WHERE id = ?",
+                    (now + self.lease_seconds, now, row["id"]),
+                )
+            conn.execute("COMMIT")
+            return dict(row) if row else None
+
+    def next_retry_at(self):
+        """待機中のジョブのうち、最も早い再試行時刻（なければ None）"""
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT MIN(next_run_at) AS t FROM jobs WHERE status = 'pending'").fetchone()
+            return row["t"]
+
+    def stage_outputs(self, job_id):
+        """完了済みの段階の出力 {段階名: 出力}"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT stage, output FROM stages WHERE job_id = ?", (job_id,)).fetchall()
+        return {row["stage"]: json.loads(row["output"]) for row in rows}
+
+    def save_stage(self, job_id, stage, output):
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO stages (job_id, stage, output, completed_at) VALUES (?, ?, ?, ?)",
+                (job_id, stage, json.dumps(output, ensure_ascii=False), now),
+            )
+            # 段階が進んでいる間はリースを延長する
+            conn.execute(
+                "UPDATE jobs SET lease_until = ?, updated_at = ? WHERE id = ?", (now + self.lease_seconds, now, job_id)
+            )
+
+    def complete(self, job_id, post_id):
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'done', post_id = ?, lease_until = NULL, last_error = NULL, updated_at = ? WHERE id = ?",
+                (post_id, now, job_id),
+            )
+
+    def fail(self, job_id, error, retryable=True):
+        """失敗を記録し、上限回数までは指数バックオフ（ジッター付き）で再試行を予約する。戻り値は再試行予定か
+
+        retryable=False は再試行しても結果が変わらない失敗（すぐに failed にする）。
+        """
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            attempts = conn.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()["attempts"] + 1
+            retry = retryable and attempts < self.max_attempts
+            delay = random.uniform(0.5, 1.0) * min(JOB_BACKOFF_MAX, JOB_BACKOFF_BASE * 2 ** (attempts - 1))
+            conn.execute(
+                """UPDATE jobs SET status = ?, attempts = ?, next_run_at = ?, lease_until = NULL,
+                   last_error = ?, updated_at = ? WHERE id = ?""",
+                ("pending" if retry else "failed", attempts, now + delay if retry else 0, error, now, job_id),
+            )
+            conn.execute("COMMIT")
+            return retry
+
+    def retry_failed(self):
+        """上限に達して失敗したジョブを再び待機状態に戻し、件数を返す（完了済みの段階は保持）"""
+        with closing(self._connect()) as conn:
+            return conn.execute(
+                "UPDATE jobs SET status = 'pending', attempts = 0, next_run_at = 0, updated_at = ? WHERE status = 'failed'",
+                (time.time(),),
+            ).rowcount
+
+    def jobs(self, statuses=None):
+        """ジョブの一覧（新しい順）。各ジョブには完了済みの段階名のリスト stages が付く"""
+        query = "SELECT j.*, GROUP_CONCAT(s.stage) AS stages FROM jobs j LEFT JOIN stages s ON s.job_id = j.id"
+        params = ()
+        if statuses:
+            query += f" WHERE j.status IN ({','.join('?' * len(statuses))})"
+            params = tuple(statuses)
+        query += " GROUP BY j.id ORDER BY j.id DESC"
+        with closing(self._connect()) as conn:
+            rows = conn.execute(query, params).fetchall()
+        return [dict(row, stages=row["stages"].split(",") if row["stages"] else []) for row in rows]
+
+    def counts(self):
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
@@ -0,0 +1,164 @@
+import json
+import os
+import threading
+
+import http_client
+
+# ==========================================
+# Gemini プロバイダー（SDK / REST）
+# ==========================================
+# どちらのプロバイダーも generate_content(contents, stream=False) を持つモデルを返し、
+# レスポンス（ストリーミング時は各チャンク）は .text と .usage_metadata を持つ。
+GEMINI_PROVIDER = os.environ.get("GEMINI_PROVIDER", "sdk")  # sdk / rest
+GEMINI_REST_URL = os.environ.get("GEMINI_REST_URL", "https://generativelanguage.googleapis.com/v1beta")
+GEMINI_REST_TIMEOUT = float(os.environ.get("GEMINI_REST_TIMEOUT", "300"))  # 秒（記事1本の生成を待てる長さ）
+
+class SDKProvider:
+    """google-generativeai SDK を使うプロバイダー
+
+    SDK の import（約1秒）と configure は最初にモデルを作る時まで遅らせる。
+    """
+
+    _configure_lock = threading.Lock()
+    _configured_key = None
+
+    def __init__(self, api_key, model_name):
+        self.api_key = api_key
+        self.model_name = model_name
+
+    def _genai(self):
+        import google.generativeai as genai
+        with self._configure_lock:
+            if SDKProvider._configured_key != self.api_key:
+                genai.configure(api_key=self.api_key)
+                SDKProvider._configured_key = self.api_key
+        return genai
+
+    def model(self, cached_content=None):
+        """生成モデル（cached_content はコンテキストキャッシュ名）"""
+        genai = self._genai()
+        if cached_content:
+            from google.generativeai import caching
+            return genai.GenerativeModel.from_cached_content(cached_content=caching.CachedContent.get(cached_content))
+        return genai.GenerativeModel(self.model_name)
+
+    def count_tokens(self, text):
+        return self._genai().GenerativeModel(self.model_name).count_tokens(text).total_tokens
+
+    def create_cache(self, system_instruction, ttl_seconds):
+        """固定のシステム指示をコンテキストキャッシュに登録してキャッシュ名を返す"""
+        from datetime import timedelta
+
+        self._genai()
+        from google.generativeai import caching
+        cached = caching.CachedContent.create(
+            model=self.model_name,
+            system_instruction=system_instruction,
+            ttl=timedelta(seconds=ttl_seconds),
+        )
+        return cached.name
+
+    def cache_exists(self, name):
+        self._genai()
+        from google.generativeai import caching
+        try:
+            caching.CachedContent.get(name)
+            return True
+        except Exception:
+            return False
+
+class RESTUsage:
+    def __init__(self, metadata):
+        self.prompt_token_count = metadata.get("promptTokenCount", 0)
+        self.candidates_token_count = metadata.get("candidatesTokenCount", 0)
+        self.total_token_count = metadata.get("totalTokenCount", 0)
+
+class RESTResponse:
+    """generateContent のレスポンス（SDK と同じく、テキストが無い場合は .text で ValueError）"""
+
+    def __init__(self, data):
+        self.data = data
+        self.usage_metadata = RESTUsage(data["usageMetadata"]) if data.get("usageMetadata") else None
+
+    @property
+    def text(self):
+        candidates = self.data.get("candidates") or []
+        parts = candidates[0].get("content", {}).get("parts", []) if candidates else []
+        texts = [part["text"] for part in parts if "text" in part]
+        if not texts:
+            reason = candidates[0].get("finishReason") if candidates else self.data.get("promptFeedback")
+            raise ValueError(f"レスポンスにテキストがありません: {reason}")
+        return "".join(texts)
+
+class RESTModel:
+    def __init__(self, provider, cached_content=None):
+        self.provider = provider
+        self.cached_content = cached_content
+        self.model_name = provider.model_name
+
+    def generate_content(self, contents, stream=False):
+        body = {"contents": [{"role": "user", "parts": [{"text": contents}]}]}
+        if self.cached_content:
+            body["cachedContent"] = self.cached_content
+        method = "streamGenerateContent" if stream else "generateContent"
+        res = self.provider.request(
+            "POST", f"models/{self.model_name}:{method}", json=body, params={"alt": "sse"} if stream else None, stream=stream
+        )
+        if not stream:
+            return RESTResponse(res.json())
+        return self._events(res)
+
+    def _events(self, res):
+        """Server-Sent Events を1チャンクずつ RESTResponse にする"""
+        # Content-Type に charset が無いと requests は Latin-1 で復号するため、バイト列のまま行に分けて UTF-8 で読む
+        with res:
+            for line in res.iter_lines():
+                if line.startswith(b"data:"):
+                    yield RESTResponse(json.loads(line[5:].decode("utf-8")))
+
+class RESTProvider:
+    """SDK を使わず、Gemini API を http_client で直接呼ぶ軽量なプロバイダー"""
+
+    def __init__(self, api_key, model_name, base_url=GEMINI_REST_URL):
+        self.api_key = api_key
+        self.model_name = model_name.removeprefix("models/")
+        self.base_url = base_url
+
+    def request(self, method, path, **kwargs):
+        kwargs.setdefault("timeout", (http_client.CONNECT_TIMEOUT, GEMINI_REST_TIMEOUT))
+        res = http_client.request(method, f"{self.base_url}/{path}", headers={"x-goog-api-key": self.api_key}, **kwargs)
+        if res.status_code != 200:
+            message = res.text[:200]
+            res.close()
+            raise RuntimeError(f"Gemini API エラー: {res.status_code} - {message}")
+        return res
+
+    def model(self, cached_content=None):
+        return RESTModel(self, cached_content)
+
+    def count_tokens(self, text):
+        res = self.request("POST", f"models/{self.model_name}:countTokens",
+                           json={"contents": [{"role": "user", "parts": [{"text": text}]}]})
+        return res.json()["totalTokens"]
+
+    def create_cache(self, system_instruction, ttl_seconds):
+        res = self.request("POST", "cachedContents", json={
+            "model": f"models/{self.model_name}",
+            "systemInstruction": {"parts": [{"text": system_instruction}]},
+            "ttl": f"{int(ttl_seconds)}s",
+        })
+        return res.json()["name"]
+
+    def cache_exists(self, name):
+        try:
+            self.request("GET", name)
+            return True
+        except RuntimeError:
+            return False
+
+PROVIDERS = {"sdk": SDKProvider, "rest": RESTProvider}
+
+def get_provider(api_key, model_name, name=GEMINI_PROVIDER):
+    if name not in PROVIDERS:
+        raise ValueError(f"未対応のGEMINI_PROVIDER: {name}（{' / '.join(PROVIDERS)}）")
+    return PROVIDERS[name](api_key, model_name)
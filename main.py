@@ -1,10 +1,25 @@
+import argparse
+import asyncio
+import hashlib
 import os
 import random
-import requests
 import re
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
-import google.generativeai as genai
+
+import http_client
+import image_processing
+import instrumentation
+import llm
+import rate_limit
+from content_index import ContentIndex
+from generation_cache import GenerationStore, make_key as make_generation_key
+from html_transform import clean_html, clean_text, insert_after, replace_placeholder
+from media_cache import MediaCache
+from rakuten_cache import RakutenCache
+from term_cache import TermCache
 
 # ==========================================
 # 0. 環境設定
@@ -16,9 +31,29 @@ PEXELS_API_KEY = os.environ.get("PEXELS_API_KEY")
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
 RAKUTEN_APP_ID = os.environ.get("RAKUTEN_APP_ID")
 RAKUTEN_AFFILIATE_ID = os.environ.get("RAKUTEN_AFFILIATE_ID")
+GEMINI_MODEL = os.environ.get("GEMINI_MODEL", "gemini-flash-latest")
+
+# Gemini のモデルは最初の生成時に作成する（SDK の import が重いため）。テストやベンチマークでは差し替え可能
+model = None
+_provider = None
+_model_lock = threading.Lock()
+
+def get_provider():
+    """Gemini プロバイダー（GEMINI_PROVIDER=sdk / rest）"""
+    global _provider
+    with _model_lock:
+        if _provider is None:
+            _provider = llm.get_provider(GEMINI_API_KEY, GEMINI_MODEL)
+        return _provider
 
-genai.configure(api_key=GEMINI_API_KEY)
-model = genai.GenerativeModel('gemini-flash-latest')
+def get_model():
+    """生成モデル（初回呼び出し時に作成）"""
+    global model
+    provider = get_provider()
+    with _model_lock:
+        if model is None:
+            model = provider.model()
+        return model
 
 # ==========================================
 # 1. 曜日別テーマ設定
@@ -58,79 +93,158 @@ def get_japan_weekday():
     jst = timezone(timedelta(hours=9))
     return datetime.now(jst).weekday()
 
+@instrumentation.stage("select_product")
 def select_product():
     weekday = get_japan_weekday()
     theme = DAILY_THEMES[weekday]
-    product = random.choice(theme["products"])
+    product = choose_uncovered_product(theme["products"])
     print(f"📅 今日は {['月','火','水','木','金','土','日'][weekday]}曜日 - カテゴリ:【{theme['category']}】")
     print(f"📦 選定商材: {product['name']}")
     return product, theme['category']
 
+def choose_uncovered_product(products):
+    """最近記事にしていない商材からランダムに選ぶ（全て作成済みなら最も前に作成した商材）"""
+    index = get_content_index()
+    cutoff = time.time() - CONTENT_RECENT_DAYS * 24 * 3600
+    last_covered = {p['id']: index.last_covered(p['id']) or 0 for p in products}
+    fresh = [p for p in products if last_covered[p['id']] < cutoff]
+    if fresh:
+        return random.choice(fresh)
+    print(f"   ℹ️ 全商材の記事が{CONTENT_RECENT_DAYS}日以内に作成済みのため、最も前に作成した商材を選択")
+    return min(products, key=lambda p: last_covered[p['id']])
+
+def find_product(product_id):
+    """商材ID（例: MON-1）から (商材, カテゴリ名) を取得"""
+    for theme in DAILY_THEMES.values():
+        for product in theme["products"]:
+            if product["id"] == product_id:
+                return product, theme["category"]
+    return None, None
+
+def find_product_by_name(name):
+    """商材名から商材を取得"""
+    for theme in DAILY_THEMES.values():
+        for product in theme["products"]:
+            if product["name"] == name:
+                return product
+    return None
+
+def products_for_category(category_name):
+    """カテゴリ名に属する全商材を取得"""
+    for theme in DAILY_THEMES.values():
+        if theme["category"] == category_name:
+            return list(theme["products"])
+    return []
+
 # ==========================================
 # 2. 楽天アフィリエイト商品検索
 # ==========================================
+RAKUTEN_SEARCH_URL = os.environ.get("RAKUTEN_SEARCH_URL", "https://app.rakuten.co.jp/services/api/IchibaItem/Search/20170706")
+RAKUTEN_SORT = "+reviewCount"  # レビュー数順
+RAKUTEN_HITS = int(os.environ.get("RAKUTEN_HITS", "3"))  # 上位何件を保持するか
+RAKUTEN_ROTATE = os.environ.get("RAKUTEN_ROTATE") == "1"  # 1 なら保持した商品を記事ごとに順番に表示
+
+_rakuten_cache = None
+_rakuten_cache_lock = threading.Lock()
+
+def get_rakuten_cache():
+    """楽天検索結果のキャッシュ（初回呼び出し時に作成）"""
+    global _rakuten_cache
+    with _rakuten_cache_lock:
+        if _rakuten_cache is None:
+            _rakuten_cache = RakutenCache()
+        return _rakuten_cache
+
+def fetch_rakuten_items(keyword, hits=RAKUTEN_HITS, sort=RAKUTEN_SORT):
+    """楽天市場を検索して上位商品のリストを返す（エラー時は None、該当なしは空リスト）"""
+    print(f"🛒 楽天で商品検索中: {keyword}")
+    params = {
+        "applicationId": RAKUTEN_APP_ID,
+        "affiliateId": RAKUTEN_AFFILIATE_ID,
+        "keyword": keyword,
+        "hits": hits,
+        "sort": sort,
+        "imageFlag": 1
+    }
+    
+    rate_limit.acquire("rakuten")
+    response = http_client.get(RAKUTEN_SEARCH_URL, params=params)
+    if response.status_code != 200:
+        print(f"   ⚠️ 楽天API エラー: {response.status_code}")
+        return None
+    
+    items = []
+    for entry in response.json().get("Items", []):
+        item = entry["Item"]
+        items.append({
+            "name": item["itemName"][:50],  # 名前を短縮
+            "price": item["itemPrice"],
+            "url": item.get("affiliateUrl") or item["itemUrl"],
+            "image": item["mediumImageUrls"][0]["imageUrl"] if item.get("mediumImageUrls") else None,
+            "shop": item["shopName"],
+            "review_count": item.get("reviewCount", 0)
+        })
+    return items
+
+def search_rakuten_items(keyword):
+    """上位商品のリストをキャッシュ優先で取得"""
+    key = RakutenCache.make_key(keyword, RAKUTEN_SORT, RAKUTEN_HITS)
+    return get_rakuten_cache().get(key, lambda: fetch_rakuten_items(keyword))
+
+@instrumentation.stage("search_rakuten_product")
 def search_rakuten_product(keyword):
     """楽天市場から商品を検索してアフィリエイトリンクを取得"""
     if not RAKUTEN_APP_ID or not RAKUTEN_AFFILIATE_ID:
         print("   ⚠️ 楽天APIキーが設定されていません")
         return None
     
-    print(f"🛒 楽天で商品検索中: {keyword}")
-    
     try:
-        url = "https://app.rakuten.co.jp/services/api/IchibaItem/Search/20170706"
-        params = {
-            "applicationId": RAKUTEN_APP_ID,
-            "affiliateId": RAKUTEN_AFFILIATE_ID,
-            "keyword": keyword,
-            "hits": 3,  # 上位3件を取得
-            "sort": "+reviewCount",  # レビュー数順
-            "imageFlag": 1
-        }
-        
-        response = requests.get(url, params=params)
-        
-        if response.status_code == 200:
-            data = response.json()
-            items = data.get("Items", [])
-            
-            if items:
-                # 最もレビューが多い商品を選択
-                best_item = items[0]["Item"]
-                result = {
-                    "name": best_item["itemName"][:50],  # 名前を短縮
-                    "price": best_item["itemPrice"],
-                    "url": best_item.get("affiliateUrl") or best_item["itemUrl"],
-                    "image": best_item["mediumImageUrls"][0]["imageUrl"] if best_item.get("mediumImageUrls") else None,
-                    "shop": best_item["shopName"],
-                    "review_count": best_item.get("reviewCount", 0)
-                }
-                print(f"   ✅ 商品発見: {result['name'][:30]}... ({result['price']:,}円)")
-                return result
-            else:
-                print("   ⚠️ 商品が見つかりませんでした")
-        else:
-            print(f"   ⚠️ 楽天API エラー: {response.status_code}")
+        items = search_rakuten_items(keyword)
+        if items:
+            # 最もレビューが多い商品を選択（巡回設定時は順番に表示）
+            index = get_rakuten_cache().next_index(keyword, len(items)) if RAKUTEN_ROTATE else 0
+            result = items[index]
+            print(f"   ✅ 商品発見: {result['name'][:30]}... ({result['price']:,}円)")
+            return result
+        elif items is not None:
+            print("   ⚠️ 商品が見つかりませんでした")
     except Exception as e:
         print(f"   ❌ 楽天検索エラー: {e}")
     
     return None
 
+def prefetch_rakuten():
+    """全商材のキーワードで楽天検索を実行してキャッシュを更新（1秒1回の制限内で順番に実行）"""
+    if not RAKUTEN_APP_ID or not RAKUTEN_AFFILIATE_ID:
+        print("   ⚠️ 楽天APIキーが設定されていません")
+        return
+    cache = get_rakuten_cache()
+    keywords = [p['name'] for theme in DAILY_THEMES.values() for p in theme['products']]
+    print(f"🛒 楽天キャッシュ一括更新: {len(keywords)}キーワード")
+    for keyword in keywords:
+        try:
+            items = fetch_rakuten_items(keyword)
+            if items is not None:
+                cache.put(RakutenCache.make_key(keyword, RAKUTEN_SORT, RAKUTEN_HITS), items)
+                print(f"   ✅ {keyword}: {len(items)}件")
+        except Exception as e:
+            print(f"   ❌ {keyword}: {e}")
+
 # ==========================================
 # 3. 記事作成
 # ==========================================
-def generate_article(product):
-    print("📝 Gemini APIでSEO記事を執筆中...")
-    
-    prompt = f"""
-あなたは「デスクワーク改善室　所長M」です。
-実務歴8年の整体師・柔道整復師として、延べ1万人以上の施術経験があります。
-解剖学・運動学の専門知識を活かし、デスクワーカーの体の悩みを解決するブログを書いています。
+GEMINI_CONTEXT_CACHE = os.environ.get("GEMINI_CONTEXT_CACHE") == "1"
+GEMINI_CONTEXT_CACHE_TTL = int(os.environ.get("GEMINI_CONTEXT_CACHE_TTL", "3600"))
+# コンテキストキャッシュに載せられる最小トークン数（モデルによって異なる。Flash 系は 1024）
+GEMINI_CONTEXT_CACHE_MIN_TOKENS = int(os.environ.get("GEMINI_CONTEXT_CACHE_MIN_TOKENS", "1024"))
+FORCE_NEW_DRAFT = os.environ.get("FORCE_NEW_DRAFT") == "1"  # 1 なら保存済みの生成結果を使わずに書き直す
 
-【商品】{product['name']}
-【ターゲットの悩み】{product['target']}
+# 記事ごとに変わらない部分（ペルソナ / 構成・文体・出力ルール）
+PERSONA_PROMPT = """あなたは「デスクワーク改善室　所長M」です。
+実務歴8年の整体師・柔道整復師として、延べ1万人以上の施術経験があります。
+解剖学・運動学の専門知識を活かし、デスクワーカーの体の悩みを解決するブログを書いています。"""
 
-【記事の構成（この順番を厳守）】
+RULES_PROMPT = """【記事の構成（この順番を厳守）】
 1. 悩みへの共感（読者の「あるある」を描写し、共感を得る）
 2. 原因の解説（解剖学・骨格・筋肉の仕組みを使って専門的に説明する）
    - 必ず具体的な筋肉名（例：脊柱起立筋、大腰筋、僧帽筋など）を使うこと
@@ -165,131 +279,465 @@ def generate_article(product):
 - <h2>で見出しを4つ以上作成すること
 - <p>で段落を作成
 - 記事中盤の商品紹介セクションに [[AFFILIATE_AREA]] を必ず1つ配置
-- <strong>タグで重要な専門用語を強調すること
+- <strong>タグで重要な専門用語を強調すること"""
+
+SYSTEM_PROMPT = f"{PERSONA_PROMPT}\n\n{RULES_PROMPT}"
+
+def build_product_prompt(product):
+    return f"""【商品】{product['name']}
+【ターゲットの悩み】{product['target']}"""
+
+def build_prompt(product):
+    return f"""
+{PERSONA_PROMPT}
+
+{build_product_prompt(product)}
+
+{RULES_PROMPT}
 """
 
+_generation_store = GenerationStore()
+_context_model = None
+_context_model_lock = threading.Lock()
+
+def get_context_cached_model():
+    """固定部分をGeminiのコンテキストキャッシュに載せたモデル（利用できなければ None）
+
+    キャッシュ名はローカルに保存し、有効期限内は別の実行からも再利用する。
+    固定部分が最小トークン数に満たない場合は作成を試みない（必ず失敗するため）。
+    """
+    global _context_model
+    with _context_model_lock:
+        if _context_model is None:
+            _context_model = False
+            try:
+                provider = get_provider()
+                system_sha = hashlib.sha256(f"{GEMINI_MODEL}\n{SYSTEM_PROMPT}".encode("utf-8")).hexdigest()
+                name = _generation_store.find_context(system_sha)
+                if not name or not provider.cache_exists(name):
+                    tokens = provider.count_tokens(SYSTEM_PROMPT)
+                    if tokens < GEMINI_CONTEXT_CACHE_MIN_TOKENS:
+                        print(f"   ℹ️ 固定部分が{tokens}トークンで、コンテキストキャッシュの最小サイズ"
+                              f"（{GEMINI_CONTEXT_CACHE_MIN_TOKENS}トークン）に満たないため通常モードで生成します")
+                        return None
+                    name = provider.create_cache(SYSTEM_PROMPT, GEMINI_CONTEXT_CACHE_TTL)
+                    _generation_store.save_context(system_sha, name, time.time() + GEMINI_CONTEXT_CACHE_TTL)
+                _context_model = provider.model(cached_content=name)
+                print(f"   🧠 コンテキストキャッシュを使用: {name}")
+            except Exception as e:
+                print(f"   ⚠️ コンテキストキャッシュを利用できません（通常モードで生成）: {e}")
+        return _context_model or None
+
+def parse_article(text):
+    """[[DELIMITER]] 区切りの生成結果をタイトル・要約・本文に分ける"""
+    parts = text.split("[[DELIMITER]]")
+    
+    if len(parts) < 3:
+        print(f"⚠️ 記事パース失敗: パーツ数={len(parts)}")
+        return None
+
+    # 本文のクリーンアップは画像挿入などと合わせて assemble_content で行う
+    return {
+        "seo_title": clean_text(parts[0]),
+        "meta_desc": clean_text(parts[1]),
+        "content": parts[2].strip()
+    }
+
+GEMINI_STREAM = os.environ.get("GEMINI_STREAM") == "1"  # 1 ならストリーミングで受信しながら区切りを解析
+GEMINI_STREAM_RETRIES = int(os.environ.get("GEMINI_STREAM_RETRIES", "2"))
+
+class ArticleFormatError(Exception):
+    """生成中の出力が [[DELIMITER]] 形式から明らかに外れている"""
+
+class DuplicateArticleError(Exception):
+    """生成した記事が既存記事と近似重複している（同じプロンプトで再生成しても同様になりやすい）"""
+
+class ArticleStreamParser:
+    """ストリーミング出力を受け取りながら、タイトル・要約・本文の区切りを逐次検出する
+
+    タイトル / 要約が確定した時点でコールバックを呼び、形式から外れた出力は途中で打ち切る。
+    """
+    DELIMITER = "[[DELIMITER]]"
+    TITLE_MAX_CHARS = 200      # タイトル欄がこれを超えても区切りが来ない → 形式違反
+    META_MAX_CHARS = 800       # 要約欄がこれを超えても区切りが来ない → 形式違反
+    BODY_TAG_WITHIN = 1500     # 本文の先頭からこの文字数以内にHTMLタグが無い → 形式違反
+
+    def __init__(self, on_title=None, on_meta=None):
+        self.on_title = on_title
+        self.on_meta = on_meta
+        self._text = ""
+        self._section_start = 0
+        self.sections = []
+
+    def feed(self, chunk):
+        self._text += chunk
+        # 区切りがチャンクをまたぐ場合に備えて、直前の区切り位置から探す
+        while len(self.sections) < 2:
+            pos = self._text.find(self.DELIMITER, self._section_start)
+            if pos < 0:
+                break
+            section = self._text[self._section_start:pos]
+            self.sections.append(section)
+            self._section_start = pos + len(self.DELIMITER)
+            if len(self.sections) == 1 and self.on_title:
+                self.on_title(clean_text(section))
+            elif len(self.sections) == 2 and self.on_meta:
+                self.on_meta(clean_text(section))
+        self._check()
+
+    def _check(self):
+        pending = len(self._text) - self._section_start
+        if len(self.sections) == 0 and pending > self.TITLE_MAX_CHARS:
+            raise ArticleFormatError(f"タイトルが{self.TITLE_MAX_CHARS}文字を超えても区切りがありません")
+        if len(self.sections) == 1 and pending > self.META_MAX_CHARS:
+            raise ArticleFormatError(f"要約が{self.META_MAX_CHARS}文字を超えても区切りがありません")
+        if len(self.sections) == 2 and pending > self.BODY_TAG_WITHIN:
+            if "<" not in self._text[self._section_start:self._section_start + self.BODY_TAG_WITHIN]:
+                raise ArticleFormatError("本文がHTML形式ではありません")
+
+    def finish(self):
+        """出力の終了時に、タイトル・要約・本文の区切りが揃っているか確認"""
+        if len(self.sections) < 2:
+            raise ArticleFormatError(f"区切りが{len(self.sections)}個のまま出力が終了しました（途中で切れた可能性）")
+
+    @property
+    def text(self):
+        return self._text
+
+def stream_generation(target_model, contents, on_title=None):
+    """ストリーミングで生成し、形式違反を検出したら途中で打ち切って ArticleFormatError を送出する"""
+    parser = ArticleStreamParser(on_title=on_title)
+    usage = None
+    for chunk in target_model.generate_content(contents, stream=True):
+        # トークン数は最後のチャンクに累計で入る
+        usage = getattr(chunk, "usage_metadata", None) or usage
+        try:
+            text = chunk.text
+        except ValueError:
+            # テキストを含まないチャンク（安全性フィルタ等）
+            continue
+        parser.feed(text)
+    instrumentation.record_tokens(usage)
+    parser.finish()
+    return parser.text
+
+@instrumentation.stage("generate_article")
+def generate_article(product, on_title=None):
+    """記事を生成（未投稿の生成結果が保存されていれば再利用）
+
+    on_title はタイトルが確定した時点で呼ばれる（ストリーミング時は生成完了前）。
+    既存記事と近似重複する場合は保存せずに DuplicateArticleError を送出する。
+    """
+    prompt = build_prompt(product)
+    key = make_generation_key(prompt, GEMINI_MODEL, product['id'])
+    
+    if not FORCE_NEW_DRAFT:
+        cached = _generation_store.find_reusable(key)
+        if cached:
+            print(f"♻️ 保存済みの生成結果を再利用: {key}")
+            if on_title:
+                on_title(cached['article']['seo_title'])
+            return dict(cached['article'], generation_key=key)
+
+    print("📝 Gemini APIでSEO記事を執筆中...")
+
     try:
-        response = model.generate_content(prompt)
-        parts = response.text.split("[[DELIMITER]]")
-        
-        if len(parts) < 3:
-            print(f"⚠️ 記事パース失敗: パーツ数={len(parts)}")
+        context_model = get_context_cached_model() if GEMINI_CONTEXT_CACHE else None
+        target_model, contents = (context_model, build_product_prompt(product)) if context_model else (get_model(), prompt)
+        if GEMINI_STREAM:
+            for attempt in range(GEMINI_STREAM_RETRIES + 1):
+                rate_limit.acquire("gemini")
+                try:
+                    text = stream_generation(target_model, contents, on_title)
+                    break
+                except ArticleFormatError as e:
+                    print(f"   ⚠️ 出力形式の崩れを検出して生成を中断: {e} ({attempt + 1}/{GEMINI_STREAM_RETRIES + 1})")
+            else:
+                return None
+        else:
+            rate_limit.acquire("gemini")
+            response = target_model.generate_content(contents)
+            instrumentation.record_tokens(getattr(response, "usage_metadata", None))
+            text = response.text
+        article = parse_article(text)
+        if not article:
             return None
+        duplicate = find_duplicate_article(article)
+        if duplicate:
+            post_id, score, title = duplicate
+            raise DuplicateArticleError(f"既存記事（投稿ID={post_id}「{title}」）と類似度{score:.2f}")
+        if on_title and not GEMINI_STREAM:
+            on_title(article['seo_title'])
 
-        # クリーンアップ処理
-        def clean_text(text):
-            text = text.strip()
-            # エスケープ文字を削除（バックスラッシュ版と円記号版の両方）
-            text = text.replace("\\n", " ").replace("\\t", " ")
-            text = text.replace("¥n", " ").replace("¥t", " ")
-            text = text.replace("\n", " ").replace("\t", " ")
-            # マークダウン記号を削除
-            text = text.replace("###", "").replace("##", "").replace("#", "")
-            # 余計なラベルを削除
-            text = text.replace("SEOタイトル:", "").replace("SEOタイトル：", "")
-            text = text.replace("メタディスクリプション:", "").replace("メタディスクリプション：", "")
-            text = text.replace("記事本文:", "").replace("記事本文：", "")
-            # コードブロックを削除
-            text = text.replace("```html", "").replace("```", "")
-            return text.strip()
-
-        return {
-            "seo_title": clean_text(parts[0]),
-            "meta_desc": clean_text(parts[1]),
-            "content": clean_text(parts[2])
-        }
+        _generation_store.save(key, GEMINI_MODEL, product['id'], prompt, text, article)
+        return dict(article, generation_key=key)
+    except DuplicateArticleError:
+        raise
     except Exception as e:
         print(f"❌ Geminiエラー: {e}")
         return None
 
-# ==========================================
-# 3. カテゴリ・タグ・画像処理
-# ==========================================
-def get_or_create_term(endpoint, name):
-    """カテゴリやタグの名前からIDを取得（なければ作成）"""
-    auth = (WP_USER, WP_APP_PASSWORD)
-    
-    print(f"   🔍 {endpoint}を検索中: {name}")
-    
-    # 1. 検索
+def generate_new_article(product, on_title=None):
+    """generate_article と同じだが、既存記事と近似重複する場合は None を返す（記事1本分の処理用）"""
     try:
-        search_url = f"{WP_URL}/wp-json/wp/v2/{endpoint}?search={name}"
-        res = requests.get(search_url, auth=auth)
-        if res.status_code == 200 and len(res.json()) > 0:
-            for item in res.json():
-                if item['name'] == name:
-                    print(f"   ✅ 既存{endpoint}を発見: ID={item['id']}")
-                    return item['id']
-    except Exception as e:
-        print(f"   ⚠️ 検索エラー: {e}")
+        return generate_article(product, on_title)
+    except DuplicateArticleError as e:
+        print(f"   ⚠️ {e}のため破棄")
+        return None
+
+def find_duplicate_article(article):
+    """生成記事と近似重複する既存記事を (投稿ID, 類似度, タイトル) で返す（なければ None）"""
+    if CONTENT_DUPLICATE_THRESHOLD <= 0:
+        return None
+    return get_content_index().find_similar(article['seo_title'], article['content'], CONTENT_DUPLICATE_THRESHOLD)
 
-    # 2. 作成
-    print(f"   📝 新規{endpoint}を作成中: {name}")
+def mark_article_posted(article, post_id):
+    """投稿済みの生成結果を再利用対象から外し、記事インデックスに追加する"""
+    if not post_id:
+        return
+    if article.get('generation_key'):
+        _generation_store.mark_posted(article['generation_key'], post_id)
     try:
-        create_url = f"{WP_URL}/wp-json/wp/v2/{endpoint}"
-        res = requests.post(create_url, json={"name": name}, auth=auth)
-        if res.status_code == 201:
-            new_id = res.json()['id']
-            print(f"   ✅ 作成成功: ID={new_id}")
-            return new_id
-        else:
-            print(f"   ❌ 作成失敗: {res.status_code} - {res.text}")
+        get_content_index().add(post_id, article['seo_title'], article['content'])
     except Exception as e:
-        print(f"   ❌ 作成エラー: {e}")
-    
-    return None
+        print(f"   ⚠️ 記事インデックスへの追加エラー: {e}")
+
+# ==========================================
+# 3. カテゴリ・タグ・画像処理
+# ==========================================
+CONTENT_DUPLICATE_THRESHOLD = float(os.environ.get("CONTENT_DUPLICATE_THRESHOLD", "0.5"))  # この類似度以上の生成記事は破棄（0 = 確認しない）
+CONTENT_RECENT_DAYS = int(os.environ.get("CONTENT_RECENT_DAYS", "30"))  # この日数以内に記事にした商材は選定で後回し
+
+_content_index = None
+_content_index_lock = threading.Lock()
 
-def get_tag_ids(keywords):
-    """キーワードリストからタグIDのリストを取得"""
-    print(f"🏷️ タグ処理開始: {keywords}")
-    tag_ids = []
-    for kw in keywords:
-        tid = get_or_create_term("tags", kw)
-        if tid:
-            tag_ids.append(tid)
-    print(f"   → 取得したタグID: {tag_ids}")
-    return tag_ids
+def get_content_index():
+    """投稿済み・下書き記事の類似検索インデックス（初回呼び出し時に作成し、WordPressと差分同期する）
 
+    同期は CONTENT_INDEX_SYNC_INTERVAL ごとに1回だけ行う。並行処理中の他の記事は同期が終わるまで待つ。
+    """
+    global _content_index
+    with _content_index_lock:
+        if _content_index is None:
+            _content_index = ContentIndex(WP_URL, (WP_USER, WP_APP_PASSWORD), find_product_id=find_affiliate_product_id)
+            try:
+                synced = _content_index.sync()
+                if synced:
+                    print(f"   🔄 記事インデックスを更新: {synced}件（合計{len(_content_index)}件）")
+            except Exception as e:
+                print(f"   ⚠️ 記事インデックスの更新エラー: {e}")
+        return _content_index
+
+_term_cache = None
+_term_cache_lock = threading.Lock()
+
+def get_term_cache():
+    """カテゴリ・タグのキャッシュ（初回呼び出し時に作成）"""
+    global _term_cache
+    with _term_cache_lock:
+        if _term_cache is None:
+            _term_cache = TermCache(WP_URL, (WP_USER, WP_APP_PASSWORD))
+        return _term_cache
+
+@instrumentation.stage("resolve_terms", ok=lambda result: result[0] is not None)
+def resolve_terms(category_name, keywords):
+    """記事1本分のカテゴリIDとタグIDをキャッシュからまとめて解決"""
+    print(f"📂 カテゴリ・タグ処理: {category_name} / {keywords}")
+    category_id, tag_ids = get_term_cache().resolve(category_name, keywords)
+    print(f"   → カテゴリID: {category_id}, タグID: {tag_ids}")
+    return category_id, tag_ids
+
+PEXELS_SEARCH_URL = os.environ.get("PEXELS_SEARCH_URL", "https://api.pexels.com/v1/search")
+PEXELS_PAGE_ROTATION = int(os.environ.get("PEXELS_PAGE_ROTATION", "0"))  # 巡回するページ数（0 = 常に1ページ目）
+
+_media_cache = None
+_media_cache_lock = threading.Lock()
+
+def get_media_cache():
+    """アップロード済み画像の索引（初回呼び出し時に作成）"""
+    global _media_cache
+    with _media_cache_lock:
+        if _media_cache is None:
+            _media_cache = MediaCache()
+        return _media_cache
+
+@instrumentation.stage("get_pexels_images")
 def get_pexels_images(query, count=3):
-    """Pexelsから複数の画像URLを取得"""
-    print(f"🖼️ 画像検索中: {query} ({count}枚)")
-    url = f"https://api.pexels.com/v1/search?query={query}&per_page={count}&orientation=landscape&size=large"
+    """Pexelsから複数の画像（{"id", "url"}）を取得"""
+    page = get_media_cache().next_page(query, PEXELS_PAGE_ROTATION) if PEXELS_PAGE_ROTATION > 1 else 1
+    print(f"🖼️ 画像検索中: {query} ({count}枚, {page}ページ目)")
+    url = f"{PEXELS_SEARCH_URL}?query={query}&per_page={count}&page={page}&orientation=landscape&size=large"
     headers = {"Authorization": PEXELS_API_KEY}
     try:
-        res = requests.get(url, headers=headers)
+        rate_limit.acquire("pexels")
+        res = http_client.get(url, headers=headers)
         if res.status_code == 200 and res.json().get('photos'):
             photos = res.json()['photos']
-            urls = [p['src']['large2x'] for p in photos]
-            print(f"   ✅ {len(urls)}枚の画像を取得")
-            return urls
+            images = [{"id": p['id'], "url": p['src']['large2x']} for p in photos]
+            print(f"   ✅ {len(images)}枚の画像を取得")
+            return images
     except Exception as e:
         print(f"   ⚠️ 画像エラー: {e}")
     return []
 
-def upload_image_to_wp(image_url, alt_text):
-    if not image_url:
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+class StreamingBody:
+    """ダウンロード中の画像レスポンスを、全体をメモリに載せずにアップロード本文として流す
+
+    流した内容の SHA-256 を同時に計算する（重複判定用）。
+    """
+
+    def __init__(self, response, length=None):
+        self._raw = response.raw
+        self.length = length
+        self.sha256 = hashlib.sha256()
+
+    def __len__(self):
+        return self.length
+
+    def read(self, size=UPLOAD_CHUNK_SIZE):
+        chunk = self._raw.read(size, decode_content=True)
+        self.sha256.update(chunk)
+        return chunk
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+def post_media(body, content_type, filename, alt_text):
+    """画像本文をWordPressへアップロードし、{"id", "source_url"} を返す
+
+    Alt テキストはアップロードと同時に送り、公開URLは作成レスポンスから取得する。
+    """
+    media_url = f"{WP_URL}/wp-json/wp/v2/media"
+    headers = {"Content-Type": content_type, "Content-Disposition": f'attachment; filename="{filename}"'}
+    res = http_client.post(media_url, headers=headers, params={"alt_text": alt_text}, data=body, auth=(WP_USER, WP_APP_PASSWORD))
+    if res.status_code == 201:
+        media = res.json()
+        print(f"   ✅ アップロード成功: ID={media['id']}")
+        return {"id": media['id'], "source_url": media.get('source_url')}
+    print(f"   ❌ アップロード失敗: {res.status_code}")
+    return None
+
+@instrumentation.stage("upload_image_to_wp")
+def upload_image_to_wp(photo, alt_text):
+    """画像をダウンロードしながらWordPressへアップロード（全体をメモリに載せない）
+
+    アップロード済みの写真は索引から既存メディアを返し、転送しない。
+    """
+    if not photo:
         return None
+    media_cache = get_media_cache()
+    cached = media_cache.find_photo(photo['id'])
+    if cached:
+        print(f"   ♻️ アップロード済み画像を再利用: ID={cached['id']}")
+        return cached
     print(f"📤 画像アップロード中...")
     try:
-        img_data = requests.get(image_url).content
-        filename = f"wp_auto_{int(time.time())}.jpg"
-        media_url = f"{WP_URL}/wp-json/wp/v2/media"
-        headers = {"Content-Type": "image/jpeg", "Content-Disposition": f'attachment; filename="{filename}"'}
-        auth = (WP_USER, WP_APP_PASSWORD)
-        res = requests.post(media_url, headers=headers, data=img_data, auth=auth)
-        if res.status_code == 201:
-            media_id = res.json()['id']
-            # Alt テキスト設定
-            requests.post(f"{WP_URL}/wp-json/wp/v2/media/{media_id}", json={"alt_text": alt_text}, auth=auth)
-            print(f"   ✅ アップロード成功: ID={media_id}")
-            return media_id
-        else:
-            print(f"   ❌ アップロード失敗: {res.status_code}")
+        with http_client.get(photo['url'], stream=True) as download:
+            if download.status_code != 200:
+                print(f"   ❌ 画像ダウンロード失敗: {download.status_code}")
+                return None
+            # 圧縮転送されている場合は長さが変わるため、チャンク転送で送る
+            length = download.headers.get("Content-Length")
+            body = StreamingBody(download, int(length) if length and not download.headers.get("Content-Encoding") else None)
+            content_type = download.headers.get("Content-Type", "image/jpeg")
+            media = post_media(body if body.length else iter(body), content_type, f"wp_auto_{photo['id']}.jpg", alt_text)
+        if media:
+            media_cache.record(photo['id'], body.sha256.hexdigest(), media)
+        return media
     except Exception as e:
         print(f"   ❌ アップロードエラー: {e}")
     return None
 
+def download_image(image_url):
+    """画像をバイト列としてダウンロード（変換処理用）"""
+    try:
+        res = http_client.get(image_url)
+        if res.status_code == 200:
+            return res.content
+        print(f"   ❌ 画像ダウンロード失敗: {res.status_code}")
+    except Exception as e:
+        print(f"   ❌ 画像ダウンロードエラー: {e}")
+    return None
+
+def upload_converted_images(images):
+    """ダウンロード → プロセスプールで縮小・再エンコード → アップロード
+
+    内容ハッシュが索引にある画像は変換・アップロードを省略する。
+    """
+    print(f"🛠️ 画像変換中: {len(images)}枚 → {image_processing.IMAGE_FORMAT} (最大幅{image_processing.IMAGE_MAX_WIDTH}px)")
+    media_cache = get_media_cache()
+    results = [None] * len(images)
+    with ThreadPoolExecutor(max_workers=len(images)) as pool:
+        blobs = list(pool.map(instrumentation.bind(download_image), [photo['url'] for photo, _ in images]))
+        hashes = [hashlib.sha256(blob).hexdigest() if blob else None for blob in blobs]
+        pending = []
+        for i, (photo, _) in enumerate(images):
+            cached = media_cache.find_hash(hashes[i]) if blobs[i] else None
+            if cached:
+                print(f"   ♻️ 同じ内容の画像を再利用: ID={cached['id']}")
+                media_cache.record(photo['id'], None, cached)
+                results[i] = cached
+            elif blobs[i]:
+                pending.append(i)
+
+        converted = dict(zip(pending, image_processing.transcode_many([blobs[i] for i in pending])))
+
+        def upload(i):
+            photo, alt_text = images[i]
+            blob = blobs[i]
+            try:
+                if converted[i] is None:
+                    # 変換できなかった画像は元のままアップロード
+                    media = post_media(blob, "image/jpeg", f"wp_auto_{photo['id']}.jpg", alt_text)
+                else:
+                    data, content_type, ext = converted[i]
+                    print(f"   🛠️ {len(blob) // 1024}KB → {len(data) // 1024}KB")
+                    media = post_media(data, content_type, f"wp_auto_{photo['id']}.{ext}", alt_text)
+                if media:
+                    media_cache.record(photo['id'], hashes[i], media)
+                return media
+            except Exception as e:
+                print(f"   ❌ アップロードエラー: {e}")
+            return None
+
+        for i, media in zip(pending, pool.map(instrumentation.bind(upload), pending)):
+            results[i] = media
+    return results
+
+@instrumentation.stage("upload_images", ok=lambda results: None not in results)
+def upload_images(images):
+    """(Pexels画像, Altテキスト) のリストを並行アップロードし、同じ順序で結果（失敗時は None）を返す
+
+    アップロード済みの写真は索引から既存メディアを再利用する。
+    """
+    if not images:
+        return []
+    media_cache = get_media_cache()
+    results = [media_cache.find_photo(photo['id']) for photo, _ in images]
+    reused = [r for r in results if r]
+    if reused:
+        print(f"   ♻️ アップロード済み画像を再利用: {[r['id'] for r in reused]}")
+    pending = [i for i, r in enumerate(results) if not r]
+    if not pending:
+        return results
+    if image_processing.is_enabled():
+        uploaded = upload_converted_images([images[i] for i in pending])
+    else:
+        with ThreadPoolExecutor(max_workers=len(pending)) as pool:
+            uploaded = list(pool.map(instrumentation.bind(lambda i: upload_image_to_wp(*images[i])), pending))
+    for i, media in zip(pending, uploaded):
+        results[i] = media
+    return results
+
+@instrumentation.stage("post_to_wordpress")
 def post_to_wordpress(article_data, media_id, category_id, tag_ids):
+    """記事を下書き投稿して投稿IDを返す（失敗時は None）"""
     print("🚀 WordPressへ投稿処理開始...")
     post_url = f"{WP_URL}/wp-json/wp/v2/posts"
     
@@ -305,7 +753,7 @@ def post_to_wordpress(article_data, media_id, category_id, tag_ids):
     
     print(f"   📋 投稿データ: カテゴリID={category_id}, タグ数={len(tag_ids)}")
     
-    res = requests.post(post_url, json=payload, auth=(WP_USER, WP_APP_PASSWORD))
+    res = http_client.post(post_url, json=payload, auth=(WP_USER, WP_APP_PASSWORD))
     if res.status_code == 201:
         post_data = res.json()
         print(f"🎉 投稿成功！")
@@ -313,98 +761,49 @@ def post_to_wordpress(article_data, media_id, category_id, tag_ids):
         print(f"   投稿ID: {post_data.get('id')}")
         print(f"   カテゴリ: {post_data.get('categories')}")
         print(f"   タグ: {post_data.get('tags')}")
+        return post_data.get('id')
     else:
         print(f"❌ 投稿失敗: {res.status_code} - {res.text}")
+    return None
 
 # ==========================================
-# 4. メイン処理
+# 4. 本文加工（画像挿入・アフィリエイト枠）
 # ==========================================
-def main():
-    print("=" * 50)
-    print("🚀 自動投稿システム v2.0 (カテゴリ・タグ自動設定)")
-    print("=" * 50)
-    
-    # 1. ネタ決め
-    product, category_name = select_product()
-    
-    # 2. カテゴリID取得（なければ作る）
-    print(f"\n📂 カテゴリ処理: {category_name}")
-    category_id = get_or_create_term("categories", category_name)
-    
-    # 3. タグID取得（なければ作る）
-    print(f"\n🏷️ タグ処理")
-    tag_ids = get_tag_ids(product['keywords'])
-    
-    # 4. 記事生成
-    print(f"\n📝 記事生成")
-    article = generate_article(product)
-    
-    if article:
-        # 5. 複数画像取得・アップロード（危機感 + 解決策のバランス）
-        print(f"\n🖼️ 画像処理（問題提起 + 解決策）")
-        
-        # 解決策画像（アイキャッチ + 本文用1枚）
-        solution_urls = get_pexels_images(product['pexels_query'], count=2)
-        
-        # 問題・危機感画像（本文用1枚）
-        problem_query = product.get('problem_query', product['pexels_query'])
-        problem_urls = get_pexels_images(problem_query, count=1)
-        
-        # アイキャッチ用（解決策画像の1枚目）
-        featured_media_id = None
-        if solution_urls:
-            featured_media_id = upload_image_to_wp(solution_urls[0], f"{product['name']} イメージ")
-        
-        # 本文挿入用の画像をアップロード
-        # 順序: 危機感画像 → 解決策画像（問題→解決の流れ）
-        content_images = problem_urls + solution_urls[1:]
-        inserted_images = []
-        
-        for i, url in enumerate(content_images):
-            label = "問題" if i == 0 else "解決策"
-            mid = upload_image_to_wp(url, f"{product['name']} {label}画像")
-            if mid:
-                try:
-                    auth = (WP_USER, WP_APP_PASSWORD)
-                    res = requests.get(f"{WP_URL}/wp-json/wp/v2/media/{mid}", auth=auth)
-                    if res.status_code == 200:
-                        inserted_images.append(res.json().get('source_url'))
-                except:
-                    pass
-        
-        print(f"   📸 本文挿入用画像: {len(inserted_images)}枚")
+MAX_INLINE_IMAGES = 2  # 本文に挿入する画像の最大数（h2の後に1枚ずつ）
 
-        # 6. 本文加工（画像挿入 + 広告枠）
-        content = article['content']
-        
-        # h2タグの後に画像を挿入
-        if inserted_images:
-            h2_pattern = r'(</h2>)'
-            h2_matches = list(re.finditer(h2_pattern, content, re.IGNORECASE))
-            
-            # 画像を均等に挿入（最大2箇所）
-            insert_positions = []
-            if len(h2_matches) >= 2:
-                insert_positions = [h2_matches[0].end(), h2_matches[1].end()]
-            elif len(h2_matches) == 1:
-                insert_positions = [h2_matches[0].end()]
-            
-            # 逆順で挿入（位置がずれないように）
-            for idx, pos in enumerate(reversed(insert_positions)):
-                img_idx = len(insert_positions) - 1 - idx
-                if img_idx < len(inserted_images):
-                    img_html = f'\\n<figure style="margin: 30px 0; text-align: center;"><img src="{inserted_images[img_idx]}" alt="{product["name"]}関連画像" style="max-width: 100%; border-radius: 12px; box-shadow: 0 4px 20px rgba(0,0,0,0.08);"/></figure>\\n'
-                    content = content[:pos] + img_html + content[pos:]
-            
-            print(f"   ✅ {min(len(insert_positions), len(inserted_images))}箇所に画像を挿入")
-        
-        # 楽天商品検索とアフィリエイト枠作成
-        print(f"\n🛒 アフィリエイト処理")
-        rakuten_product = search_rakuten_product(product['name'])
-        
-        if rakuten_product:
-            # 楽天商品が見つかった場合
-            affiliate_box = f"""
+def build_figure(image_url, product_name):
+    return f'<figure style="margin: 30px 0; text-align: center;"><img src="{image_url}" alt="{product_name}関連画像" style="max-width: 100%; border-radius: 12px; box-shadow: 0 4px 20px rgba(0,0,0,0.08);"/></figure>'
+
+AFFILIATE_BOX_START = "<!-- affiliate-box:{product_id} -->"
+AFFILIATE_BOX_END = "<!-- /affiliate-box -->"
+_box_prefix, _box_suffix = AFFILIATE_BOX_START.split("{product_id}")
+AFFILIATE_BOX_START_RE = re.compile(re.escape(_box_prefix) + r"(?P<product_id>[\w-]+)" + re.escape(_box_suffix))
+# 枠の見出し（マーカー導入前の枠は見出しの商材名で商材を特定する）
+AFFILIATE_TITLE_RE = re.compile(r"🌿 所長Mおすすめの(?P<name>.+?)</h3>")
+
+def find_affiliate_product(content):
+    """本文のアフィリエイト枠の商材を返す（マーカーの無い旧形式の枠は見出しの商材名から。見つからなければ None）"""
+    match = AFFILIATE_BOX_START_RE.search(content)
+    if match:
+        product, _ = find_product(match.group("product_id"))
+        return product
+    title = AFFILIATE_TITLE_RE.search(content)
+    return find_product_by_name(title.group("name")) if title else None
+
+def find_affiliate_product_id(content):
+    product = find_affiliate_product(content)
+    return product['id'] if product else None
+
+def build_affiliate_box(product, rakuten_product):
+    """楽天商品情報からアフィリエイト枠のHTMLを作成
+
+    後から価格やリンクを更新できるよう、枠の前後に商材IDを含むコメントを付ける。
+    """
+    start = AFFILIATE_BOX_START.format(product_id=product['id'])
+    if rakuten_product:
+        # 楽天商品が見つかった場合
+        return f"""
+{start}
 <div style="margin: 40px 0; padding: 25px; background: linear-gradient(135deg, #faf8f5 0%, #f5f0e8 100%); border: 2px solid #c9b99a; border-radius: 15px; box-shadow: 0 4px 15px rgba(0,0,0,0.05);">
     <h3 style="margin-top:0; color:#6b8e6b; font-size: 1.2em; text-align:center;">🌿 所長Mおすすめの{product['name']}</h3>
     <div style="display: flex; align-items: center; gap: 20px; margin: 20px 0; flex-wrap: wrap; justify-content: center;">
@@ -417,34 +816,194 @@ def main():
     </div>
     <a href="{rakuten_product['url']}" target="_blank" rel="nofollow sponsored" style="display: block; background: linear-gradient(135deg, #bf0000 0%, #e60033 100%); color: #fff; padding: 15px 30px; border-radius: 30px; text-decoration: none; font-weight: bold; text-align: center; margin-top: 15px;">楽天市場で詳細を見る</a>
 </div>
+{AFFILIATE_BOX_END}
 """
-        else:
-            # 商品が見つからなかった場合（フォールバック）
-            affiliate_box = f"""
+    # 商品が見つからなかった場合（フォールバック）
+    return f"""
+{start}
 <div style="margin: 40px 0; padding: 30px; background: linear-gradient(135deg, #faf8f5 0%, #f5f0e8 100%); border: 2px solid #c9b99a; border-radius: 15px; text-align: center; box-shadow: 0 4px 15px rgba(0,0,0,0.05);">
     <h3 style="margin-top:0; color:#6b8e6b; font-size: 1.3em;">🌿 所長Mおすすめの{product['name']}</h3>
     <p style="color:#7a6b5a; margin: 15px 0;">デスクワーク改善室が厳選したアイテムです</p>
     <a href="https://search.rakuten.co.jp/search/mall/{product['name']}/" target="_blank" rel="nofollow" style="display: inline-block; background: linear-gradient(135deg, #bf0000 0%, #e60033 100%); color: #fff; padding: 12px 25px; border-radius: 25px; text-decoration: none; font-weight: bold;">楽天市場で探す</a>
 </div>
+{AFFILIATE_BOX_END}
 """
+
+def assemble_content(content, product, inserted_images, rakuten_product):
+    """本文のクリーンアップ・画像挿入・アフィリエイト枠の差し込み
+
+    枠のHTMLはクリーンアップ後に差し込む（枠内のCSSカラーや改行を加工しない）。
+    """
+    figures = [build_figure(url, product['name']) for url in inserted_images[:MAX_INLINE_IMAGES]]
+    content, inserted = insert_after(clean_html(content.strip()), "h2", figures)
+    if figures:
+        print(f"   ✅ {inserted}箇所に画像を挿入")
+    return replace_placeholder(content, "[[AFFILIATE_AREA]]", build_affiliate_box(product, rakuten_product))
+
+def article_image_plan(product, solution_images, problem_images):
+    """アップロードする (Pexels画像, Altテキスト) のリスト。先頭はアイキャッチ（解決策画像の1枚目）"""
+    images = []
+    if solution_images:
+        images.append((solution_images[0], f"{product['name']} イメージ"))
+    # 本文挿入用の画像
+    # 順序: 危機感画像 → 解決策画像（問題→解決の流れ）
+    content_images = problem_images + solution_images[1:]
+    for i, photo in enumerate(content_images):
+        label = "問題" if i == 0 else "解決策"
+        images.append((photo, f"{product['name']} {label}画像"))
+    return images
+
+def upload_article_images(product, solution_images, problem_images):
+    """アイキャッチと本文用画像を並行アップロードして (アイキャッチID, 本文用画像URLリスト) を返す"""
+    results = upload_images(article_image_plan(product, solution_images, problem_images))
+    return split_uploaded_images(results, has_featured=bool(solution_images))
+
+def split_uploaded_images(results, has_featured):
+    """upload_images の結果を (アイキャッチID, 本文用画像URLリスト) に分ける"""
+    results = list(results)
+    featured_media_id = None
+    if has_featured:
+        featured = results.pop(0)
+        featured_media_id = featured['id'] if featured else None
+    inserted_images = [r['source_url'] for r in results if r and r['source_url']]
+    
+    print(f"   📸 本文挿入用画像: {len(inserted_images)}枚")
+    return featured_media_id, inserted_images
+
+# ==========================================
+# 5. 記事1本分の処理（逐次 / 並行）
+# ==========================================
+def run_article(product, category_name):
+    """1記事分の処理を順番に実行して投稿IDを返す
+
+    ストリーミング生成時はタイトルが確定した時点でタグ・画像検索を先行して開始する。
+    """
+    problem_query = product.get('problem_query', product['pexels_query'])
+    instrumentation.set_labels(product_id=product['id'])
+    
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        prefetch = {}
+
+        def start_prefetch(title):
+            if prefetch:
+                return
+            print(f"   ⚡ タイトル確定「{title}」→ カテゴリ・タグ処理と画像検索を先行開始")
+            prefetch['terms'] = executor.submit(instrumentation.bind(resolve_terms), category_name, product['keywords'])
+            prefetch['solution'] = executor.submit(instrumentation.bind(get_pexels_images), product['pexels_query'], 2)
+            prefetch['problem'] = executor.submit(instrumentation.bind(get_pexels_images), problem_query, 1)
+
+        # 1. 記事生成
+        print(f"\n📝 記事生成")
+        article = generate_new_article(product, on_title=start_prefetch if GEMINI_STREAM else None)
         
-        if "[[AFFILIATE_AREA]]" in content:
-            content = content.replace("[[AFFILIATE_AREA]]", affiliate_box)
+        if not article:
+            print("❌ 記事生成失敗")
+            return None
+
+        # 2-3. カテゴリ・タグID取得（キャッシュ優先、なければ作る）
+        print(f"\n📂 カテゴリ・タグ処理")
+        if prefetch:
+            category_id, tag_ids = prefetch['terms'].result()
+        else:
+            category_id, tag_ids = resolve_terms(category_name, product['keywords'])
+
+        # 5. 複数画像取得・アップロード（危機感 + 解決策のバランス）
+        print(f"\n🖼️ 画像処理（問題提起 + 解決策）")
+        if prefetch:
+            solution_images, problem_images = prefetch['solution'].result(), prefetch['problem'].result()
         else:
-            content += affiliate_box
+            # 解決策画像（アイキャッチ + 本文用1枚）
+            solution_images = get_pexels_images(product['pexels_query'], count=2)
+            # 問題・危機感画像（本文用1枚）
+            problem_images = get_pexels_images(problem_query, count=1)
+    
+    featured_media_id, inserted_images = upload_article_images(product, solution_images, problem_images)
 
-        article['content'] = content
+    # 6. 楽天商品検索 → 本文加工（画像挿入 + 広告枠）
+    print(f"\n🛒 アフィリエイト処理")
+    rakuten_product = search_rakuten_product(product['name'])
+    article['content'] = assemble_content(article['content'], product, inserted_images, rakuten_product)
 
-        # 7. 投稿
-        print(f"\n📮 WordPress投稿")
-        post_to_wordpress(article, featured_media_id, category_id, tag_ids)
+    # 7. 投稿
+    print(f"\n📮 WordPress投稿")
+    post_id = post_to_wordpress(article, featured_media_id, category_id, tag_ids)
+    mark_article_posted(article, post_id)
+    return post_id
 
-    else:
+async def prepare_images_async(product):
+    """Pexels検索2件を並行実行し、続けて全画像を並行アップロード"""
+    problem_query = product.get('problem_query', product['pexels_query'])
+    solution_images, problem_images = await asyncio.gather(
+        asyncio.to_thread(get_pexels_images, product['pexels_query'], 2),
+        asyncio.to_thread(get_pexels_images, problem_query, 1),
+    )
+    return await asyncio.to_thread(upload_article_images, product, solution_images, problem_images)
+
+async def run_article_async(product, category_name):
+    """1記事分の処理を依存関係グラフとして並行実行して投稿IDを返す
+
+    カテゴリ・タグ・記事生成・画像（検索→アップロード）・楽天検索は互いに独立しているため同時に走らせ、
+    投稿だけが全ての結果を待つ。所要時間はおおむね最長の経路（Gemini生成）に収まる。
+    """
+    instrumentation.set_labels(product_id=product['id'])
+    print(f"\n⚡ 並行処理開始: カテゴリ / タグ / 記事生成 / 画像 / 楽天")
+    (category_id, tag_ids), article, (featured_media_id, inserted_images), rakuten_product = await asyncio.gather(
+        asyncio.to_thread(resolve_terms, category_name, product['keywords']),
+        asyncio.to_thread(generate_new_article, product),
+        prepare_images_async(product),
+        asyncio.to_thread(search_rakuten_product, product['name']),
+    )
+
+    if not article:
         print("❌ 記事生成失敗")
+        return None
+
+    article['content'] = assemble_content(article['content'], product, inserted_images, rakuten_product)
+
+    print(f"\n📮 WordPress投稿")
+    post_id = await asyncio.to_thread(post_to_wordpress, article, featured_media_id, category_id, tag_ids)
+    mark_article_posted(article, post_id)
+    return post_id
+
+# ==========================================
+# 6. メイン処理
+# ==========================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SEOアフィリエイト記事の自動投稿")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="API呼び出しを並行実行する（記事生成・画像・楽天・タグを同時に処理）")
+    parser.add_argument("--prefetch-rakuten", action="store_true",
+                        help="記事は作成せず、全商材の楽天検索結果をキャッシュに取得する")
+    parser.add_argument("--new-draft", action="store_true",
+                        help="保存済みの生成結果を使わずに記事を書き直す")
+    args = parser.parse_args(argv)
+
+    global FORCE_NEW_DRAFT
+    if args.new_draft:
+        FORCE_NEW_DRAFT = True
+
+    if args.prefetch_rakuten:
+        prefetch_rakuten()
+        return
+
+    print("=" * 50)
+    print("🚀 自動投稿システム v2.0 (カテゴリ・タグ自動設定)")
+    print("=" * 50)
+    
+    # 1. ネタ決め
+    product, category_name = select_product()
+    
+    if args.use_async:
+        asyncio.run(run_article_async(product, category_name))
+    else:
+        run_article(product, category_name)
     
+    print()
+    http_client.print_stats()
+    instrumentation.finish_run()
     print("\n" + "=" * 50)
     print("✅ 処理完了")
     print("=" * 50)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
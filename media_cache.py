@@ -0,0 +1,49 @@
+import os
+import threading
+
+from term_cache import CACHE_DIR, load_json, save_json
+
+# ==========================================
+# アップロード済み画像のローカル索引（重複アップロード防止）
+# ==========================================
+MEDIA_CACHE_PATH = os.path.join(CACHE_DIR, "wp_media.json")
+
+class MediaCache:
+    """Pexels写真ID・内容ハッシュ → WordPressメディア（id, source_url）の対応を保持する索引
+
+    同じ写真が再び選ばれた場合は、ダウンロードもアップロードもせずに既存メディアを再利用する。
+    検索クエリごとの次に取得するページ番号も記録し、古い写真ばかりにならないようにする。
+    """
+
+    def __init__(self, path=MEDIA_CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._data = load_json(path, {})
+        for key in ("photos", "hashes", "pages"):
+            self._data.setdefault(key, {})
+
+    def find_photo(self, photo_id):
+        with self._lock:
+            return self._data["photos"].get(str(photo_id))
+
+    def find_hash(self, sha256):
+        with self._lock:
+            return self._data["hashes"].get(sha256)
+
+    def record(self, photo_id, sha256, media):
+        """アップロード結果を写真IDと内容ハッシュの両方で登録"""
+        entry = {"id": media["id"], "source_url": media.get("source_url")}
+        with self._lock:
+            if photo_id is not None:
+                self._data["photos"][str(photo_id)] = entry
+            if sha256:
+                self._data["hashes"][sha256] = entry
+            save_json(self.path, self._data)
+
+    def next_page(self, query, max_pages):
+        """クエリごとに 1 → max_pages の順で検索ページを巡回する"""
+        with self._lock:
+            page = self._data["pages"].get(query, 1)
+            self._data["pages"][query] = page % max_pages + 1
+            save_json(self.path, self._data)
+            return page
@@ -0,0 +1,76 @@
+import os
+import threading
+import time
+
+from term_cache import CACHE_DIR, load_json, save_json
+
+# ==========================================
+# 楽天商品検索結果のローカルキャッシュ
+# ==========================================
+RAKUTEN_CACHE_PATH = os.path.join(CACHE_DIR, "rakuten.json")
+RAKUTEN_CACHE_TTL = int(os.environ.get("RAKUTEN_CACHE_TTL", str(24 * 3600)))           # この期間は再検索しない
+RAKUTEN_CACHE_MAX_AGE = int(os.environ.get("RAKUTEN_CACHE_MAX_AGE", str(7 * 24 * 3600)))  # この期間までは古い結果を返しつつ裏で更新
+
+class RakutenCache:
+    """キーワード・並び順ごとの上位商品リストを保持するキャッシュ（stale-while-revalidate）
+
+    - TTL 以内: キャッシュをそのまま返す
+    - TTL 超過〜MAX_AGE 以内: キャッシュを返し、バックグラウンドで再検索する
+    - それ以外: その場で検索する
+    """
+
+    def __init__(self, path=RAKUTEN_CACHE_PATH, ttl=RAKUTEN_CACHE_TTL, max_age=RAKUTEN_CACHE_MAX_AGE):
+        self.path = path
+        self.ttl = ttl
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._data = load_json(path, {})
+        for key in ("results", "rotation"):
+            self._data.setdefault(key, {})
+
+    @staticmethod
+    def make_key(keyword, sort, hits):
+        return f"{keyword}|{sort}|{hits}"
+
+    def put(self, key, items):
+        with self._lock:
+            self._data["results"][key] = {"fetched_at": time.time(), "items": items}
+            save_json(self.path, self._data)
+
+    def _refresh(self, key, fetch):
+        try:
+            items = fetch()
+            if items is not None:
+                self.put(key, items)
+        except Exception as e:
+            print(f"   ⚠️ 楽天キャッシュ更新エラー: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def get(self, key, fetch):
+        """キャッシュから商品リストを取得（fetch は検索を実行して商品リストを返す関数）"""
+        with self._lock:
+            entry = self._data["results"].get(key)
+            age = time.time() - entry["fetched_at"] if entry else None
+            if entry and age < self.ttl:
+                return entry["items"]
+            if entry and age < self.max_age:
+                if key not in self._refreshing:
+                    self._refreshing.add(key)
+                    threading.Thread(target=self._refresh, args=(key, fetch), daemon=True).start()
+                print(f"   ♻️ 楽天キャッシュを使用（バックグラウンドで更新中）")
+                return entry["items"]
+        items = fetch()
+        if items is not None:
+            self.put(key, items)
+        return items
+
+    def next_index(self, keyword, count):
+        """キーワードごとに 0 → count-1 の順で表示する商品を巡回する"""
+        with self._lock:
+            index = self._data["rotation"].get(keyword, 0) % count
+            self._data["rotation"][keyword] = index + 1
+            save_json(self.path, self._data)
+            return index
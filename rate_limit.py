@@ -0,0 +1,52 @@
+import os
+import threading
+import time
+from collections import deque
+
+# ==========================================
+# 外部APIのレート制限
+# ==========================================
+class RateLimiter:
+    """period 秒あたり max_calls 回までに呼び出しを抑えるスレッドセーフなリミッター（スライディングウィンドウ）"""
+
+    def __init__(self, max_calls, period):
+        self.max_calls = max_calls
+        self.period = period
+        self._calls = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """枠が空くまで待機してから1回分を消費する"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._calls and now - self._calls[0] >= self.period:
+                    self._calls.popleft()
+                if len(self._calls) < self.max_calls:
+                    self._calls.append(now)
+                    return
+                wait = self.period - (now - self._calls[0])
+            time.sleep(wait)
+
+_limiters = {}
+
+def configure(service, max_calls, period):
+    """サービスごとの制限を設定（max_calls が 0 以下なら無制限）"""
+    if max_calls and max_calls > 0:
+        _limiters[service] = RateLimiter(max_calls, period)
+    else:
+        _limiters.pop(service, None)
+
+def acquire(service):
+    """サービスの呼び出し枠を1つ消費（制限未設定なら即座に戻る）"""
+    limiter = _limiters.get(service)
+    if limiter:
+        limiter.acquire()
+
+# デフォルト設定（環境変数で上書き可能）
+# - Gemini: 1分あたりのリクエスト数（0 = 無制限）
+# - Pexels: 1時間あたりのリクエスト数（無料枠は200回/時）
+# - 楽天: 1秒あたり1リクエスト
+configure("gemini", int(os.environ.get("GEMINI_QPM", "0")), 60)
+configure("pexels", int(os.environ.get("PEXELS_PER_HOUR", "200")), 3600)
+configure("rakuten", int(os.environ.get("RAKUTEN_PER_SECOND", "1")), 1)
@@ -0,0 +1,175 @@
+import argparse
+import os
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import http_client
+import main as pipeline
+import rate_limit
+from main import (
+    AFFILIATE_BOX_END, AFFILIATE_BOX_START_RE, build_affiliate_box, fetch_rakuten_items, find_affiliate_product, find_product,
+    search_rakuten_items,
+)
+from term_cache import CACHE_DIR, load_json, save_json
+
+# ==========================================
+# 投稿済み記事のアフィリエイト枠を最新の楽天情報で更新
+# ==========================================
+CHECKPOINT_PATH = os.path.join(CACHE_DIR, "refresh_affiliate.json")
+POST_STATUSES = "publish,future,draft,pending,private"
+
+MARKED_BOX_RE = re.compile(AFFILIATE_BOX_START_RE.pattern + ".*?" + re.escape(AFFILIATE_BOX_END), re.S)
+# マーカー導入前の枠（外側の div の開始タグ）
+LEGACY_BOX_START = '<div style="margin: 40px 0; padding: '
+DIV_TAG_RE = re.compile(r"<div\b|</div>")
+HREF_RE = re.compile(r'<a href="(?P<url>[^"]*)"')
+
+def find_affiliate_box(content):
+    """本文中のアフィリエイト枠を探し、(開始位置, 終了位置, 商材) を返す（見つからなければ None）"""
+    match = MARKED_BOX_RE.search(content)
+    if match:
+        product, _ = find_product(match.group("product_id"))
+        return (match.start(), match.end(), product) if product else None
+
+    # マーカーの無い旧形式: 見出しで商材を特定し、div の入れ子を数えて枠の終わりを探す
+    start = content.find(LEGACY_BOX_START)
+    while start >= 0:
+        depth = 0
+        for tag in DIV_TAG_RE.finditer(content, start):
+            depth += 1 if tag.group() == "<div" else -1
+            if depth == 0:
+                end = tag.end()
+                product = find_affiliate_product(content[start:end])
+                if product:
+                    return start, end, product
+                break
+        start = content.find(LEGACY_BOX_START, start + 1)
+    return None
+
+def pick_item(items, current_box):
+    """現在の枠と同じ商品があればその最新情報を、なければ先頭の商品を使う"""
+    href = HREF_RE.search(current_box)
+    current_url = href.group("url") if href else None
+    for item in items:
+        if item["url"] == current_url:
+            return item
+    return items[0] if items else None
+
+def render_post(post, force_fetch=False):
+    """投稿本文のアフィリエイト枠を描き直し、変化があれば新しい本文を返す（変化なしは None）"""
+    content = post["content"]["raw"]
+    found = find_affiliate_box(content)
+    if not found:
+        return None
+    start, end, product = found
+    items = fetch_rakuten_items(product["name"]) if force_fetch else search_rakuten_items(product["name"])
+    if items is None:
+        # 楽天APIのエラー時は既存の枠を残す
+        return None
+    new_box = build_affiliate_box(product, pick_item(items, content[start:end])).strip()
+    if content[start:end] == new_box:
+        return None
+    return content[:start] + new_box + content[end:]
+
+def update_post(post_id, content):
+    rate_limit.acquire("wordpress")
+    res = http_client.request(
+        "PATCH",
+        f"{pipeline.WP_URL}/wp-json/wp/v2/posts/{post_id}",
+        json={"content": content},
+        auth=(pipeline.WP_USER, pipeline.WP_APP_PASSWORD),
+    )
+    return res.status_code == 200
+
+def fetch_posts_page(page):
+    """投稿を1ページ分（id・本文・更新日時のみ）取得し、(投稿リスト, 総ページ数) を返す"""
+    rate_limit.acquire("wordpress")
+    res = http_client.get(
+        f"{pipeline.WP_URL}/wp-json/wp/v2/posts",
+        params={
+            "context": "edit",
+            "_fields": "id,content,modified",
+            "status": POST_STATUSES,
+            "orderby": "id",
+            "order": "asc",
+            "per_page": 100,
+            "page": page,
+        },
+        auth=(pipeline.WP_USER, pipeline.WP_APP_PASSWORD),
+    )
+    if res.status_code != 200:
+        raise RuntimeError(f"投稿一覧の取得失敗: {res.status_code} - {res.text[:200]}")
+    return res.json(), int(res.headers.get("X-WP-TotalPages", 1))
+
+def refresh_all(concurrency=4, dry_run=False, force_fetch=False, restart=False):
+    """全投稿を走査して枠を更新する。ページ単位でチェックポイントを保存し、中断後は続きから再開する"""
+    checkpoint = {} if restart else load_json(CHECKPOINT_PATH, {})
+    page = checkpoint.get("next_page", 1)
+    done = set(checkpoint.get("done", []))
+    counts = {"checked": 0, "updated": 0, "failed": 0}
+    if page > 1 or done:
+        print(f"⏩ チェックポイントから再開: {page}ページ目（処理済み {len(done)}件）")
+
+    def process(post):
+        try:
+            new_content = render_post(post, force_fetch)
+            if new_content is None:
+                return "unchanged"
+            if dry_run:
+                print(f"   📝 更新対象: 投稿ID={post['id']} (更新日時 {post['modified']})")
+                return "updated"
+            if update_post(post["id"], new_content):
+                print(f"   ✅ 更新: 投稿ID={post['id']}")
+                return "updated"
+            print(f"   ❌ 更新失敗: 投稿ID={post['id']}")
+        except Exception as e:
+            print(f"   ❌ 更新エラー: 投稿ID={post['id']}: {e}")
+        return "failed"
+
+    # 失敗した投稿があるページは、次回そのページから再開する（処理済みの投稿は done で飛ばす）
+    retry_from = None
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        total_pages = page
+        while page <= total_pages:
+            posts, total_pages = fetch_posts_page(page)
+            print(f"📄 {page}/{total_pages}ページ目: {len(posts)}件")
+            targets = [p for p in posts if p["id"] not in done]
+            for post, result in zip(targets, pool.map(process, targets)):
+                counts["checked"] += 1
+                if result == "failed":
+                    counts["failed"] += 1
+                    retry_from = retry_from or page
+                else:
+                    counts["updated"] += result == "updated"
+                    done.add(post["id"])
+            page += 1
+            if not dry_run:
+                save_json(CHECKPOINT_PATH, {"next_page": retry_from or page, "done": sorted(done)})
+
+    if not dry_run and not counts["failed"] and os.path.exists(CHECKPOINT_PATH):
+        os.remove(CHECKPOINT_PATH)
+    return counts
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="投稿済み記事のアフィリエイト枠（価格・リンク）を最新の楽天情報で更新する")
+    parser.add_argument("--concurrency", type=int, default=4, help="同時に更新する投稿数（デフォルト: 4）")
+    parser.add_argument("--wp-per-second", type=int, default=5, help="WordPress APIの1秒あたりリクエスト上限（デフォルト: 5）")
+    parser.add_argument("--fetch", action="store_true", help="キャッシュを使わずに楽天APIへ問い合わせる")
+    parser.add_argument("--dry-run", action="store_true", help="更新対象を表示するだけで書き込まない")
+    parser.add_argument("--restart", action="store_true", help="チェックポイントを無視して最初からやり直す")
+    args = parser.parse_args(argv)
+
+    rate_limit.configure("wordpress", args.wp_per_second, 1)
+
+    print("=" * 50)
+    print("🔄 アフィリエイト枠の一括更新")
+    print("=" * 50)
+    counts = refresh_all(args.concurrency, args.dry_run, args.fetch, args.restart)
+    print(f"\n   確認: {counts['checked']}件 / 更新: {counts['updated']}件 / 失敗: {counts['failed']}件")
+    print()
+    http_client.print_stats()
+    return 1 if counts["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
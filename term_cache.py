@@ -0,0 +1,124 @@
+import html
+import json
+import os
+import threading
+import time
+
+import http_client
+
+# ==========================================
+# WordPress カテゴリ・タグのローカルキャッシュ
+# ==========================================
+CACHE_DIR = os.environ.get("CACHE_DIR", ".cache")
+TERM_CACHE_PATH = os.path.join(CACHE_DIR, "wp_terms.json")
+TERM_CACHE_TTL = int(os.environ.get("TERM_CACHE_TTL", str(7 * 24 * 3600)))  # デフォルト7日
+
+def load_json(path, default):
+    """JSONファイルを読み込む（存在しない・壊れている場合は default）"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+def save_json(path, data):
+    """一時ファイル経由で書き込み、途中で落ちても壊れたファイルを残さない"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+class TermCache:
+    """タグ・カテゴリの 名前→ID 対応をディスクに保持し、期限切れ時に一括で取り直すキャッシュ
+
+    キャッシュにない名前だけ WordPress 上に作成する。別プロセスが先に作成していた場合
+    （term_exists エラー）は、そのレスポンスに含まれる既存IDを使う。
+    """
+
+    def __init__(self, wp_url, auth, path=TERM_CACHE_PATH, ttl=TERM_CACHE_TTL):
+        self.wp_url = wp_url
+        self.auth = auth
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._data = load_json(path, {})
+
+    def _is_fresh(self, endpoint):
+        entry = self._data.get(endpoint)
+        return bool(entry) and time.time() - entry.get("fetched_at", 0) < self.ttl
+
+    def warm(self, endpoint):
+        """/wp-json/wp/v2/{endpoint} を per_page=100 でページングして全件取得"""
+        print(f"   🔄 {endpoint}キャッシュを更新中...")
+        terms = {}
+        page, total_pages = 1, 1
+        while page <= total_pages:
+            res = http_client.get(
+                f"{self.wp_url}/wp-json/wp/v2/{endpoint}",
+                params={"per_page": 100, "page": page, "_fields": "id,name"},
+                auth=self.auth,
+            )
+            if res.status_code != 200:
+                print(f"   ⚠️ {endpoint}一覧の取得失敗: {res.status_code}")
+                return False
+            for item in res.json():
+                terms[html.unescape(item["name"])] = item["id"]
+            total_pages = int(res.headers.get("X-WP-TotalPages", 1))
+            page += 1
+        with self._lock:
+            self._data[endpoint] = {"fetched_at": time.time(), "terms": terms}
+            save_json(self.path, self._data)
+        print(f"   ✅ {endpoint}キャッシュ: {len(terms)}件")
+        return True
+
+    def _ensure_fresh(self, endpoint):
+        with self._lock:
+            if self._is_fresh(endpoint):
+                return
+            try:
+                self.warm(endpoint)
+            except Exception as e:
+                print(f"   ⚠️ {endpoint}キャッシュ更新エラー: {e}")
+
+    def _create(self, endpoint, name):
+        print(f"   📝 新規{endpoint}を作成中: {name}")
+        res = http_client.post(f"{self.wp_url}/wp-json/wp/v2/{endpoint}", json={"name": name}, auth=self.auth)
+        if res.status_code == 201:
+            new_id = res.json()["id"]
+            print(f"   ✅ 作成成功: ID={new_id}")
+            return new_id
+        body = res.json() if res.headers.get("Content-Type", "").startswith("application/json") else {}
+        if body.get("code") == "term_exists":
+            # 別の実行が先に作成済み
+            existing_id = body.get("data", {}).get("term_id")
+            print(f"   ✅ 既存{endpoint}を発見: ID={existing_id}")
+            return existing_id
+        print(f"   ❌ 作成失敗: {res.status_code} - {res.text}")
+        return None
+
+    def get_or_create(self, endpoint, name):
+        """名前からIDを取得（キャッシュになければ作成してキャッシュに追加）"""
+        self._ensure_fresh(endpoint)
+        with self._lock:
+            term_id = self._data.get(endpoint, {}).get("terms", {}).get(name)
+            if term_id:
+                return term_id
+            try:
+                term_id = self._create(endpoint, name)
+            except Exception as e:
+                print(f"   ❌ 作成エラー: {e}")
+                return None
+            if term_id:
+                entry = self._data.setdefault(endpoint, {"fetched_at": 0, "terms": {}})
+                entry["terms"][name] = term_id
+                save_json(self.path, self._data)
+            return term_id
+
+    def resolve(self, category_name, tag_names):
+        """記事1本分のカテゴリIDとタグIDリストをまとめて解決"""
+        self._ensure_fresh("categories")
+        self._ensure_fresh("tags")
+        category_id = self.get_or_create("categories", category_name) if category_name else None
+        tag_ids = [tid for tid in (self.get_or_create("tags", n) for n in tag_names) if tid]
+        return category_id, tag_ids
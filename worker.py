@@ -0,0 +1,223 @@
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import instrumentation
+import main as pipeline
+from batch import print_summary, resolve_targets
+from job_store import JobStore
+
+# ==========================================
+# ジョブキューの実行（段階ごとに結果を保存し、失敗したら続きから再試行）
+# ==========================================
+JOB_MAX_WAIT = float(os.environ.get("JOB_MAX_WAIT", "300"))  # 秒（これより先の再試行は次回の実行に回す）
+# 1 = 画像が1枚でもアップロードできなければジョブを失敗にする（0 = 再試行の上限に達したらアップロードできた画像だけで投稿）
+JOB_REQUIRE_ALL_IMAGES = os.environ.get("JOB_REQUIRE_ALL_IMAGES", "0") == "1"
+
+class StageError(Exception):
+    """段階の結果が使えない（再試行の対象）"""
+
+class PermanentStageError(StageError):
+    """再試行しても結果が変わらない（ジョブをすぐに失敗にする）"""
+
+def _required(value, message):
+    if not value:
+        raise StageError(message)
+    return value
+
+def run_job(store, job, use_async=False):
+    """ジョブを未完了の段階から実行して投稿IDを返す
+
+    記事生成・カテゴリ/タグ・画像検索・楽天検索は互いに独立しているため、use_async のときは同時に実行する。
+    各段階の出力は完了した時点で保存されるため、後の段階で失敗しても再試行時にトークンやアップロードを再消費しない。
+    """
+    product, category_name = pipeline.find_product(job["product_id"])
+    if not product:
+        raise StageError(f"商材IDが見つかりません: {job['product_id']}")
+    instrumentation.set_labels(product_id=product['id'], job_id=job["id"])
+    outputs = store.stage_outputs(job["id"])
+    if outputs:
+        print(f"⏩ ジョブ{job['id']} ({product['id']}): 完了済みの段階 {sorted(outputs)} を再利用")
+
+    def run_stage(name, fn):
+        if name not in outputs:
+            outputs[name] = fn()
+            store.save_stage(job["id"], name, outputs[name])
+        return outputs[name]
+
+    def terms():
+        category_id, tag_ids = pipeline.resolve_terms(category_name, product['keywords'])
+        _required(category_id, "カテゴリIDを取得できませんでした")
+        return {"category_id": category_id, "tag_ids": tag_ids}
+
+    def article():
+        try:
+            return _required(pipeline.generate_article(product), "記事生成に失敗しました")
+        except pipeline.DuplicateArticleError as e:
+            # 同じプロンプトでの再生成はトークンを消費するだけになりやすいため、再試行しない
+            raise PermanentStageError(f"{e}のため破棄しました") from e
+
+    def images():
+        problem_query = product.get('problem_query', product['pexels_query'])
+        found = {
+            "solution": pipeline.get_pexels_images(product['pexels_query'], count=2),
+            "problem": pipeline.get_pexels_images(problem_query, count=1),
+        }
+        _required(found["solution"] or found["problem"], "Pexels画像を取得できませんでした")
+        return found
+
+    def rakuten():
+        # 該当商品なしの場合も既定の枠で投稿できるため、再試行しない
+        return {"item": pipeline.search_rakuten_product(product['name'])}
+
+    independent = {"article": article, "terms": terms, "images": images, "rakuten": rakuten}
+    if use_async:
+        with ThreadPoolExecutor(max_workers=len(independent)) as pool:
+            futures = [pool.submit(instrumentation.bind(run_stage), name, fn) for name, fn in independent.items()]
+        for future in futures:
+            future.result()
+    else:
+        for name, fn in independent.items():
+            run_stage(name, fn)
+
+    def media():
+        found = outputs["images"]
+        plan = pipeline.article_image_plan(product, found["solution"], found["problem"])
+        results = pipeline.upload_images(plan)
+        failed = results.count(None)
+        if failed:
+            message = f"画像アップロードに失敗しました（{failed}/{len(results)}枚）"
+            # アップロードできた画像は索引に記録されるため、再試行時は失敗した画像だけを送り直す
+            if JOB_REQUIRE_ALL_IMAGES or job["attempts"] + 1 < store.max_attempts:
+                raise StageError(message)
+            print(f"   ⚠️ {message}。再試行の上限に達したため、アップロードできた画像だけで投稿します")
+        featured_media_id, inserted_images = pipeline.split_uploaded_images(results, has_featured=bool(found["solution"]))
+        return {"featured_media_id": featured_media_id, "inserted_images": inserted_images}
+
+    run_stage("media", media)
+
+    def post():
+        generated = dict(outputs["article"])
+        generated['content'] = pipeline.assemble_content(
+            generated['content'], product, outputs["media"]["inserted_images"], outputs["rakuten"]["item"]
+        )
+        post_id = pipeline.post_to_wordpress(
+            generated, outputs["media"]["featured_media_id"], outputs["terms"]["category_id"], outputs["terms"]["tag_ids"]
+        )
+        pipeline.mark_article_posted(generated, post_id)
+        return _required(post_id, "WordPressへの投稿に失敗しました")
+
+    return run_stage("post", post)
+
+def drain(store, concurrency=1, use_async=False, max_wait=JOB_MAX_WAIT):
+    """キューが空になるまでジョブを実行し、ジョブごとの最終結果のリストを返す
+
+    再試行待ちのジョブは max_wait 秒以内に実行可能になるものだけ待つ（それ以降は次回の実行に回す）。
+    """
+    results = {}
+    results_lock = threading.Lock()
+
+    def process(job):
+        started = time.monotonic()
+        product, _ = pipeline.find_product(job["product_id"])
+        try:
+            post_id, error = run_job(store, job, use_async), None
+            store.complete(job["id"], post_id)
+        except Exception as e:
+            post_id = None
+            error = str(e) if isinstance(e, StageError) else f"{type(e).__name__}: {e}"
+            if store.fail(job["id"], error, retryable=not isinstance(e, PermanentStageError)):
+                print(f"   🔁 ジョブ{job['id']} ({job['product_id']}) 失敗、再試行を予約: {error}")
+            elif isinstance(e, PermanentStageError):
+                print(f"   ❌ ジョブ{job['id']} ({job['product_id']}) 失敗（再試行しません）: {error}")
+            else:
+                print(f"   ❌ ジョブ{job['id']} ({job['product_id']}) 再試行の上限に達しました: {error}")
+        with results_lock:
+            previous = results.get(job["id"], {"elapsed": 0.0})
+            results[job["id"]] = {
+                "product_id": job["product_id"],
+                "name": product["name"] if product else job["product_id"],
+                "post_id": post_id,
+                "error": error,
+                "elapsed": previous["elapsed"] + time.monotonic() - started,
+            }
+
+    def work():
+        while True:
+            job = store.claim()
+            if job:
+                process(job)
+                continue
+            next_at = store.next_retry_at()
+            if next_at is None or next_at - time.time() > max_wait:
+                return
+            time.sleep(max(0.0, min(next_at - time.time(), 5.0)))
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(work) for _ in range(concurrency)]:
+            future.result()
+    return list(results.values())
+
+def print_status(store, show_all=False):
+    counts = store.counts()
+    print("📋 ジョブ: " + " / ".join(f"{status} {counts.get(status, 0)}件" for status in ("pending", "running", "done", "failed")))
+    for job in store.jobs(None if show_all else ("pending", "running", "failed")):
+        line = f"   #{job['id']} {job['product_id']} [{job['status']}] 試行{job['attempts']}回 完了段階={job['stages']}"
+        if job["post_id"]:
+            line += f" 投稿ID={job['post_id']}"
+        if job["last_error"] and job["status"] != "done":
+            line += f" エラー: {job['last_error']}"
+        print(line)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="記事ジョブのキュー（中断・失敗した記事を完了済みの段階から再開する）")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run", help="指定した記事をキューに追加し、キューが空になるまで実行する")
+    run_parser.add_argument("product_ids", nargs="*", help="追加する商材ID（例: MON-1 TUE-2）")
+    run_parser.add_argument("--today", action="store_true", help="今日の曜日テーマから1記事を追加する（main.py と同じ選び方）")
+    run_parser.add_argument("--category", help="指定カテゴリの全商材を追加する")
+    run_parser.add_argument("--all", dest="all_products", action="store_true", help="全カテゴリの全商材を追加する")
+    run_parser.add_argument("--concurrency", type=int, default=1, help="同時に処理するジョブ数（デフォルト: 1）")
+    run_parser.add_argument("--async", dest="use_async", action="store_true", help="ジョブ内の独立した段階を並行実行する")
+    run_parser.add_argument("--max-wait", type=float, default=JOB_MAX_WAIT,
+                            help=f"再試行待ちのジョブを待つ最大秒数（デフォルト: {JOB_MAX_WAIT:.0f}）")
+
+    status_parser = sub.add_parser("status", help="未完了・失敗したジョブを表示する")
+    status_parser.add_argument("--all", dest="show_all", action="store_true", help="完了済みのジョブも表示する")
+
+    sub.add_parser("retry-failed", help="再試行の上限に達したジョブを待機状態に戻す")
+    args = parser.parse_args(argv)
+
+    store = JobStore()
+    if args.command == "status":
+        print_status(store, args.show_all)
+        return 0
+    if args.command == "retry-failed":
+        print(f"🔁 {store.retry_failed()}件のジョブを再試行対象に戻しました")
+        return 0
+
+    targets = resolve_targets(args.product_ids, args.category, args.all_products)
+    if args.today:
+        targets.append(pipeline.select_product())
+    for product, category_name in targets:
+        job_id = store.enqueue(product['id'], category_name)
+        print(f"➕ ジョブ{job_id}: {product['id']} {product['name']}")
+
+    print("=" * 50)
+    print(f"🚀 ジョブ実行開始: 同時実行数 {args.concurrency}")
+    print("=" * 50)
+    results = drain(store, args.concurrency, args.use_async, args.max_wait)
+    if not results:
+        print("   実行可能なジョブはありません")
+        return 0
+    print_summary(results)
+    print()
+    print_status(store)
+    return 0 if all(r["post_id"] for r in results) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())